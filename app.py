@@ -1,22 +1,38 @@
 import concurrent.futures as cf
+import functools
 import glob
+import hashlib
 import io
 import os
+import queue
+import random
+import re
+import threading
+import tempfile
 import time
 import warnings
 import logging
+import mmap
+from collections import OrderedDict
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
-from typing import List, Literal
+from urllib.parse import urlparse
+from typing import Dict, List, Literal, Optional, Tuple
 import gradio as gr
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ReadTimeoutError
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
-import pymupdf
-from bs4 import BeautifulSoup
-import ebooklib
-from ebooklib import epub
+try:
+    from selectolax.parser import HTMLParser
+except ImportError:  # 未安裝 selectolax 時改用 BeautifulSoup
+    HTMLParser = None
+# pymupdf、ebooklib、BeautifulSoup 在提取函數內延遲導入，加快啟動並減少未上傳該格式時的記憶體佔用
 
 # 導入自定義模組
-from prompts import get_prompt, get_all_template_names
+from prompts import get_prompt, get_all_template_names, get_max_output_tokens
 from quality_control import DialogueQualityChecker, validate_dialogue_structure, suggest_improvements
 from content_planner import ContentPlanner, SmartContentSplitter, create_adaptive_prompts
 
@@ -39,23 +55,391 @@ quality_checker = DialogueQualityChecker()
 content_planner = ContentPlanner()
 content_splitter = SmartContentSplitter()
 
+# 共用 HTTP 連線池：保持連線並重用 TLS 握手，連線建立失敗由 urllib3 自動重試
+# 只有 GET/HEAD 會因 5xx 自動重試；POST（LLM 生成、Discord 上傳）不可冪等，
+# 5xx 可能代表伺服器已處理請求，重送會重複生成或重複發文，交由呼叫端的重試迴圈處理。
+# 429 也由呼叫端處理，其等待時間受 RETRY_MAX_DELAY 與 RETRY_BUDGET_SECONDS 限制
+_SESSION = requests.Session()
+_SESSION_ADAPTER = HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=20,
+    max_retries=Retry(
+        total=2,
+        read=0,
+        backoff_factor=0.3,
+        status_forcelist=[500, 502, 503, 504],
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        respect_retry_after_header=False,
+        raise_on_status=False  # 重試用盡時返回最後的回應，由呼叫端依狀態碼處理
+    )
+)
+_SESSION.mount("https://", _SESSION_ADAPTER)
+_SESSION.mount("http://", _SESSION_ADAPTER)
+
+# LLM 回應快取（LRU）：重複的內容大綱請求直接返回
+RESPONSE_CACHE_MAX_ENTRIES = 256
+_RESPONSE_CACHE: "OrderedDict[Tuple, str]" = OrderedDict()
+_RESPONSE_CACHE_LOCK = threading.Lock()
+
+# 截斷檢測：以未完成的句尾詞，或內容不足 10 字的最後一行 speaker 發言作結，視為被截斷
+TRUNCATION_TAIL_CHARS = 256
+_TRUNCATION_TAIL_PATTERN = re.compile(
+    r"(?:在|的|了|是|會|但|因為|所以|這|那)\Z"
+    r"|^speaker-[^\n:]*:[ \t]*[^\n]{0,9}\Z",
+    re.MULTILINE
+)
+
+# 接受 prompt_cache_key 欄位的 API 主機；其他相容 API 可能拒絕未知欄位，因此不傳送
+PROMPT_CACHE_KEY_HOSTS = ("api.openai.com",)
+
+# 串流時每收到多少段內容回報一次進度
+STREAM_PROGRESS_INTERVAL = 200
+
+# 串流內容更新介面的最短間隔（秒），期間到達的內容合併成一次更新
+UI_UPDATE_INTERVAL = 0.2
+
+# LLM 請求的連線逾時秒數；讀取逾時由 request_timeout 參數控制
+LLM_CONNECT_TIMEOUT = 5
+DEFAULT_REQUEST_TIMEOUT = 120.0
+# 模型列表請求的 (連線逾時, 讀取逾時) 秒數
+MODELS_REQUEST_TIMEOUT = (3, 10)
+
+# 模型列表快取：(模型列表 URL, API 金鑰雜湊) -> (取得時間, 模型列表)
+MODELS_CACHE_TTL = 300
+_MODELS_CACHE: Dict[Tuple[str, str], Tuple[float, List[str]]] = {}
+
+# 重試等待的初始秒數；每個請求（含分批生成的各部分）都從此值開始退避
+RETRY_INITIAL_DELAY = 5
+
+# 單次重試等待的上限秒數（指數退避的封頂值）
+RETRY_MAX_DELAY = 60
+
+# 整次腳本生成（含分批生成的各部分）所有重試等待時間的總上限秒數
+RETRY_BUDGET_SECONDS = 90
+
+# 逐部分生成時，作為下一部分上下文的前一部分結尾字數
+SEQUENTIAL_CONTEXT_TAIL_CHARS = 1500
+
+# 分批生成時同時請求的部分數；設為 1 則逐部分生成，並以前一部分的內容作為上下文
+BATCH_PARTS_CONCURRENCY = 4
+
+# 常見模型系列的上下文視窗（tokens），模型 ID 等於該名稱或以「名稱-」開頭時套用；未列出的模型不做預檢
+MODEL_CONTEXT_WINDOWS = {
+    "gemini-1.5-pro": 2097152,
+    "gemini-1.5": 1048576,
+    "gemini-2.0": 1048576,
+    "gemini-2.5": 1048576,
+    "gpt-4.1": 1047576,
+    "gpt-4o": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-3.5-turbo": 16385,
+    "claude": 200000,
+}
+
+# 只在模型 ID 完全相同時套用的上下文視窗；gpt-4 的其他變體（-32k、-preview、gpt-4.5 等）視窗較大，不以前綴比對
+MODEL_CONTEXT_WINDOWS_EXACT = {
+    "gpt-4": 8192,
+    "gpt-4-0314": 8192,
+    "gpt-4-0613": 8192,
+}
+
+# 多文件並行提取的進程數，可用環境變數 PDF_LOAD_WORKERS 調整（設為 1 則逐一處理）
+PDF_LOAD_WORKERS = int(os.getenv("PDF_LOAD_WORKERS", min(os.cpu_count() or 1, 4)))
+
+# 多文件提取共用的進程池，跨請求重用以免每次重新啟動子進程
+_EXTRACTION_POOL: Optional[cf.ProcessPoolExecutor] = None
+_EXTRACTION_POOL_LOCK = threading.Lock()
+
+# PDF 解析器，可用環境變數 PDF_PARSER 設為 pypdfium2（需另行安裝）；預設使用 PyMuPDF
+PDF_PARSER = os.getenv("PDF_PARSER", "pymupdf").lower()
+
+# PDF 頁數達到此門檻才按頁段並行提取，避免小文件承擔進程啟動成本
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", 100))
+
+# 單一 PDF 按頁段並行提取的進程數，可用環境變數 PDF_PAGE_WORKERS 調整（設為 1 則不並行）
+PDF_PAGE_WORKERS = int(os.getenv("PDF_PAGE_WORKERS", max(1, min((os.cpu_count() or 1) - 1, 6))))
+
+# 按頁段並行提取時，每個進程平均分到的頁段數
+PDF_BLOCKS_PER_WORKER = 4
+
+# 單一 PDF 按頁段並行提取共用的進程池，跨請求重用以免每次提取都重新啟動子進程
+_PAGE_POOL: Optional[cf.ProcessPoolExecutor] = None
+_PAGE_POOL_LOCK = threading.Lock()
+
+
+# 提取結果快取：以文件內容的 SHA-256、PDF 解析器與提取版本為鍵，重新生成時免去重複解析
+# 放在使用者自己的快取目錄，不使用多使用者共用且路徑可預測的系統暫存目錄；
+# 共用或託管部署不宜保存上傳文件全文時，設定環境變數 PDF2PODCAST_EXTRACT_CACHE=0 關閉
+EXTRACTION_CACHE_ENABLED = os.getenv("PDF2PODCAST_EXTRACT_CACHE", "1") != "0"
+EXTRACTION_CACHE_DIR = Path.home() / ".cache" / "pdf2podcast" / "extract"
+EXTRACTION_CACHE_MAX_FILES = 64
+# 提取邏輯（旗標、HTML 轉文字等）改變輸出時遞增，使舊的快取不再命中
+EXTRACTION_CACHE_VERSION = 1
+
+# 腳本回應的磁碟快取：設定環境變數 PDF2PODCAST_CACHE=1 啟用，相同輸入重新生成時直接返回先前結果
+DIALOGUE_CACHE_ENABLED = os.getenv("PDF2PODCAST_CACHE") == "1"
+DIALOGUE_CACHE_DIR = Path.home() / ".cache" / "pdf2podcast"
+
+
+class ApiError(Exception):
+    """API 請求失敗或參數無效"""
+
 
 def fetch_models(api_key, api_base=None):
     """
     Fetch the list of models from the given API base.
+    Successful results are cached for MODELS_CACHE_TTL seconds.
+
+    Raises:
+        ApiError: when the API base is malformed or the request fails
     """
+    # 明顯無效的 URL 直接返回，不進行 DNS 解析與連線
+    if api_base and urlparse(api_base).scheme not in ("http", "https"):
+        raise ApiError(f"Error fetching models: invalid API base URL '{api_base}'")
+
     base_url = api_base.rstrip("/") + "/models" if api_base else "https://api.openai.com/v1/models"
     headers = {"Authorization": f"Bearer {api_key}"}
+
+    # 以 API 金鑰的雜湊作為快取鍵，避免在記憶體中保留明文金鑰
+    cache_key = (base_url, hashlib.sha256(api_key.encode("utf-8")).hexdigest())
+    cached = _MODELS_CACHE.get(cache_key)
+    if cached and time.monotonic() - cached[0] < MODELS_CACHE_TTL:
+        logger.info(f"使用快取的模型列表: {base_url}")
+        return list(cached[1])
     
     try:
-        response = requests.get(base_url, headers=headers)
+        response = _SESSION.get(base_url, headers=headers, timeout=MODELS_REQUEST_TIMEOUT)
         if response.status_code == 200:
-            models = response.json().get('data', [])
-            return [model['id'] for model in models]
-        else:
-            return [f"Error fetching models: {response.status_code} {response.reason}"]
+            # 以 orjson 直接解析原始位元組，略過 requests 的編碼偵測與標準 json 解析
+            models = orjson.loads(response.content).get('data', [])
+            model_ids = [model['id'] for model in models]
+            _MODELS_CACHE[cache_key] = (time.monotonic(), model_ids)
+            return list(model_ids)
+    except (requests.RequestException, orjson.JSONDecodeError) as e:
+        raise ApiError(f"Error fetching models: {str(e)}") from e
+    raise ApiError(f"Error fetching models: {response.status_code} {response.reason}")
+
+
+def _iter_stream_lines(response):
+    """
+    逐行讀取串流回應
+
+    串流中途的讀取逾時會被 requests 包成 ConnectionError，這裡轉回 ReadTimeout，
+    呼叫端可與等待回應標頭時的逾時一樣立即重試，而不是走一般錯誤的退避等待。
+    """
+    try:
+        yield from response.iter_lines()
+    except requests.exceptions.ConnectionError as e:
+        if e.args and isinstance(e.args[0], ReadTimeoutError):
+            raise requests.exceptions.ReadTimeout(e.args[0], response=response) from e
+        raise
+
+
+def _read_streamed_completion(response, stream_callback=None, progress_callback=None) -> Tuple[str, Optional[str]]:
+    """
+    讀取 SSE 串流回應並累積生成內容
+
+    Args:
+        response: 以 stream=True 發出的回應
+        stream_callback: 每收到一段新內容時以該段文字呼叫
+        progress_callback: 每收到 STREAM_PROGRESS_INTERVAL 段內容回報一次進度
+
+    Returns:
+        Tuple[str, Optional[str]]: 完整的生成內容，以及最後回報的 finish_reason
+
+    Raises:
+        requests.exceptions.ReadTimeout: 兩段資料之間的等待超過讀取逾時
+        requests.exceptions.RequestException: 串流中出現供應商回報的錯誤事件
+    """
+    chunks = []
+    finish_reason = None
+    for line in _iter_stream_lines(response):
+        if not line.startswith(b"data:"):
+            continue
+        data = line[5:].strip()
+        if data == b"[DONE]":
+            break
+        try:
+            event = orjson.loads(data)
+        except ValueError:
+            logger.debug(f"略過無法解析的串流資料: {data[:100]}")
+            continue
+
+        error = event.get("error")
+        if error:
+            message = error.get("message", error) if isinstance(error, dict) else error
+            # 轉為 requests 的例外，呼叫端沿用既有的錯誤處理與重試
+            raise requests.exceptions.RequestException(f"API 串流回報錯誤: {message}", response=response)
+
+        choices = event.get("choices") or []
+        if not choices:
+            continue
+        finish_reason = choices[0].get("finish_reason") or finish_reason
+        delta = (choices[0].get("delta") or {}).get("content")
+        if delta:
+            chunks.append(delta)
+            if stream_callback:
+                stream_callback(delta)
+            if progress_callback and len(chunks) % STREAM_PROGRESS_INTERVAL == 0:
+                progress_callback(f"已接收 {len(chunks)} 段生成內容...")
+
+    return "".join(chunks), finish_reason
+
+
+def _chat_endpoint(api_base: str, api_key: str) -> Tuple[str, Dict[str, str]]:
+    """返回聊天補全 API 的 URL 與請求標頭"""
+    url = f"{api_base.rstrip('/')}/chat/completions"
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+    return url, headers
+
+
+def _chat_payload(model: str, prompt: str, max_tokens: int, temperature: float = 0.7, **extra) -> Dict:
+    """建立單輪使用者訊息的聊天補全請求內容"""
+    return {
+        "model": model,
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        **extra
+    }
+
+
+def _chat_completion(url: str, headers: Dict[str, str], payload: Dict, request_timeout: float = DEFAULT_REQUEST_TIMEOUT) -> str:
+    """發送非串流的聊天補全請求並返回生成內容"""
+    response = _SESSION.post(url, headers=headers, data=orjson.dumps(payload), timeout=(LLM_CONNECT_TIMEOUT, request_timeout))
+    response.raise_for_status()
+    try:
+        return orjson.loads(response.content)['choices'][0]['message']['content']
+    except orjson.JSONDecodeError as e:
+        # 轉為 requests 的例外，呼叫端沿用既有的錯誤處理
+        raise requests.exceptions.InvalidJSONError(f"無法解析 API 回應: {e}", response=response) from e
+
+
+def _chat_completion_cached(url: str, headers: Dict[str, str], payload: Dict, request_timeout: float = DEFAULT_REQUEST_TIMEOUT) -> str:
+    """
+    同 _chat_completion，但以 (URL, 模型, 訊息雜湊, temperature, max_tokens) 為鍵快取成功的回應
+
+    僅用於內容大綱等結果可重用的請求；失敗的請求不會被快取。
+    """
+    messages_hash = hashlib.sha256(orjson.dumps(payload["messages"])).hexdigest()
+    cache_key = (url, payload["model"], messages_hash, payload.get("temperature"), payload.get("max_tokens"))
+    with _RESPONSE_CACHE_LOCK:
+        if cache_key in _RESPONSE_CACHE:
+            _RESPONSE_CACHE.move_to_end(cache_key)
+            logger.info("命中回應快取，略過 API 請求")
+            return _RESPONSE_CACHE[cache_key]
+
+    content = _chat_completion(url, headers, payload, request_timeout)
+    with _RESPONSE_CACHE_LOCK:
+        _RESPONSE_CACHE[cache_key] = content
+        while len(_RESPONSE_CACHE) > RESPONSE_CACHE_MAX_ENTRIES:
+            _RESPONSE_CACHE.popitem(last=False)
+    return content
+
+
+def _get_context_window(model: str) -> Optional[int]:
+    """依模型名稱查詢上下文視窗大小，未知模型返回 None"""
+    # 去除 "models/"、"openai/" 等供應商前綴
+    model_name = (model or "").lower().rsplit("/", 1)[-1]
+    if model_name in MODEL_CONTEXT_WINDOWS_EXACT:
+        return MODEL_CONTEXT_WINDOWS_EXACT[model_name]
+    # 優先比對最長（最具體）的系列名稱
+    for name in sorted(MODEL_CONTEXT_WINDOWS, key=len, reverse=True):
+        if model_name == name or model_name.startswith(name + "-"):
+            return MODEL_CONTEXT_WINDOWS[name]
+    return None
+
+
+def _estimate_tokens(text: str) -> int:
+    """
+    粗略估算文本的 token 數
+
+    中日韓等非 ASCII 字元約 1 字 1 token，ASCII 文字約 4 字元 1 token。
+    """
+    ascii_count = len(text.encode("ascii", "ignore"))
+    return (len(text) - ascii_count) + ascii_count // 4
+
+
+def _truncate_to_token_budget(text: str, estimated_tokens: int, budget: int) -> str:
+    """依 token 預算按比例截斷文本，並盡量在句子邊界結束"""
+    keep = int(len(text) * budget / estimated_tokens)
+    truncated = text[:keep]
+    # 在最後 1000 字元內尋找句子結尾，避免截在句子中間
+    boundary = max(truncated.rfind(mark, max(0, keep - 1000)) for mark in ("。", "！", "？", ". ", "\n"))
+    if boundary > 0:
+        truncated = truncated[:boundary + 1]
+    return truncated
+
+
+class _RetryBudget:
+    """整次腳本生成共用的重試等待預算，並行生成的各部分共用同一份"""
+
+    def __init__(self, seconds: float):
+        self.remaining = seconds
+        self._lock = threading.Lock()
+
+    def take(self, delay: float) -> bool:
+        """扣除一次等待時間，預算不足時返回 False 表示應放棄重試"""
+        with self._lock:
+            if delay > self.remaining:
+                return False
+            self.remaining -= delay
+            return True
+
+
+def _backoff_delay(retry_delay: float) -> float:
+    """完全抖動（full jitter）的退避時間，避免多個工作階段同時重試"""
+    return random.uniform(0, min(retry_delay, RETRY_MAX_DELAY))
+
+
+def _dialogue_cache_file(url: str, payload: Dict, num_parts: int) -> Path:
+    """
+    以請求端點、payload 與分批數計算腳本快取檔案路徑
+
+    訊息內容先正規化空白再計算雜湊，同一份文件重新匯出或換行、縮排不同時仍可命中快取。
+    """
+    normalized = dict(payload)
+    normalized["messages"] = [
+        {**message, "content": " ".join(message["content"].split())}
+        for message in payload["messages"]
+    ]
+    key = hashlib.blake2b(orjson.dumps(normalized, option=orjson.OPT_SORT_KEYS), digest_size=16)
+    key.update(f"\0{url}\0{num_parts}".encode("utf-8"))
+    return DIALOGUE_CACHE_DIR / f"{key.hexdigest()}.txt"
+
+
+def _read_dialogue_cache(cache_file: Path) -> Optional[str]:
+    """讀取腳本快取，不存在或無法讀取時返回 None"""
+    try:
+        content = cache_file.read_text(encoding="utf-8")
+    except OSError:
+        return None
+    logger.info(f"命中腳本快取: {cache_file.name}")
+    return content
+
+
+def _write_dialogue_cache(cache_file: Path, content: str) -> None:
+    """以原子替換方式寫入腳本快取，失敗時只記錄警告"""
+    try:
+        DIALOGUE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=DIALOGUE_CACHE_DIR, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, cache_file)
+    except OSError as e:
+        logger.warning(f"寫入腳本快取失敗: {e}")
+
+
+def _warm_up_connection(api_base: str) -> None:
+    """預先建立到 API 端點的連線，讓之後的請求重用連線池中已完成握手的連線"""
+    try:
+        _SESSION.head(api_base.rstrip("/") + "/models", timeout=MODELS_REQUEST_TIMEOUT, allow_redirects=False)
+        logger.debug(f"已預先建立連線: {api_base}")
     except requests.RequestException as e:
-        return [f"Error fetching models: {str(e)}"]
+        logger.debug(f"預先建立連線失敗: {e}")
 
 
 def generate_dialogue_via_requests(
@@ -68,11 +452,15 @@ def generate_dialogue_via_requests(
     max_input_length: int = 1000000,
     max_output_tokens: int = 65536,
     progress_callback=None,
-    template_type: str = "podcast"
+    template_type: str = "podcast",
+    stream_callback=None,
+    request_timeout: float = DEFAULT_REQUEST_TIMEOUT
 ) -> str:
     """
     Generate dialogue by making a direct request to the LLM API.
     使用簡化版本，暫時不使用複雜的內容規劃
+
+    stream_callback 會在收到每段串流內容時被呼叫；重試前會以 None 呼叫，表示先前的部分內容作廢。
     """
     logger.info(f"準備生成對話，使用模型: {model}")
     
@@ -94,62 +482,96 @@ def generate_dialogue_via_requests(
     
     # 使用直接從 prompts 模組獲取的模板
     try:
-        base_prompt = get_prompt(template_type, pdf_text)
+        template_overhead = get_prompt(template_type)
     except KeyError:
         # 如果模板不存在，使用默認的 podcast 模板
         logger.warning(f"模板 '{template_type}' 不存在，使用默認 podcast 模板")
-        base_prompt = get_prompt("podcast", pdf_text)
-    
-    # 如果有自定義提示詞，添加到提示中
-    if user_feedback:
-        base_prompt += f"\n\n【額外要求】\n{user_feedback}"
+        template_type = "podcast"
+        template_overhead = get_prompt(template_type)
 
-    headers = {
-        "Authorization": f"Bearer {llm_api_key}",
-        "Content-Type": "application/json"
-    }
+    # 預估 token 數，超出模型上下文視窗時提前截斷或拒絕，避免整份上傳後才失敗
+    context_window = _get_context_window(model)
+    if context_window:
+        output_tokens = max_output_tokens
+        overhead = _estimate_tokens(template_overhead) + _estimate_tokens(user_feedback or "")
+        budget = context_window - output_tokens - overhead
+        if budget <= 0:
+            error_msg = f"錯誤：模型 {model} 的上下文視窗（約 {context_window} tokens）不足以容納 {output_tokens} 個輸出 tokens，請調低最大輸出 Token 數。"
+            logger.error(error_msg)
+            if progress_callback:
+                progress_callback(error_msg)
+            return error_msg
+
+        estimated_tokens = _estimate_tokens(pdf_text)
+        if estimated_tokens > budget:
+            pdf_text = _truncate_to_token_budget(pdf_text, estimated_tokens, budget)
+            logger.info(f"輸入文本超出模型上下文，已截斷: 約 {estimated_tokens} -> {budget} tokens ({len(pdf_text)} 字符)")
+            if progress_callback:
+                progress_callback(f"輸入文本超出模型上下文視窗，已截斷至 {len(pdf_text)} 字符")
+
+    # 如果有自定義提示詞，添加到提示中；與模板一次合併，不再複製整份提示詞
+    feedback_suffix = f"\n\n【額外要求】\n{user_feedback}" if user_feedback else ""
+    base_prompt = get_prompt(template_type, pdf_text, feedback_suffix)
 
-    base_url = api_base.rstrip("/")
-    url = f"{base_url}/chat/completions"
+    url, headers = _chat_endpoint(api_base, llm_api_key)
     logger.info(f"準備發送請求到 API: {url}")
     
     if progress_callback:
         progress_callback("正在發送請求到 LLM API...")
 
-    # 重試參數
+    # 重試參數；等待預算由本次生成的所有請求（含分批生成）共用
     max_retries = 5
-    retry_delay = 5
+    retry_delay = RETRY_INITIAL_DELAY
+    retry_budget = _RetryBudget(RETRY_BUDGET_SECONDS)
 
-    # 使用可調整的輸出 token 限制
-    payload = {
-        "model": model,
-        "messages": [
-            {
-                "role": "user",
-                "content": base_prompt
-            }
-        ],
-        "temperature": 0.7,
-        "max_tokens": max_output_tokens,  # 可調整的輸出 token 數
-        "stream": False  # 先不用流式，確保穩定性
-    }
+    # 使用可調整的輸出 token 限制，並以流式接收讓介面即時顯示內容
+    payload = _chat_payload(model, base_prompt, max_output_tokens, stream=True)
+    # 模板的固定說明在前、文件內容在後、額外要求在最後，同一份文件重新生成時共用最長的前綴
+    prompt_cache_key = _prompt_cache_key(url, pdf_text)
+    if prompt_cache_key:
+        payload["prompt_cache_key"] = prompt_cache_key
+
+    # 完全相同的請求命中磁碟快取時直接返回，省去整次 LLM 生成
+    cache_file = _dialogue_cache_file(url, payload, num_parts) if DIALOGUE_CACHE_ENABLED else None
+    cached_content = _read_dialogue_cache(cache_file) if cache_file is not None else None
+    if cached_content is not None:
+        if progress_callback:
+            progress_callback("命中腳本快取，直接返回先前生成的結果")
+        return cached_content
+
+    # 以 orjson 序列化一次，提示詞內含整份文件文字時明顯快於標準 json；重試時直接重用請求本體
+    body = orjson.dumps(payload)
     
     for attempt in range(max_retries):
         try:
             logger.info(f"發送 API 請求 (嘗試 {attempt+1}/{max_retries})...")
             if progress_callback:
                 progress_callback(f"API 請求中 (嘗試 {attempt+1}/{max_retries})...")
+            if stream_callback and attempt > 0:
+                stream_callback(None)
                 
-            response = requests.post(url, headers=headers, json=payload)
+            response = _SESSION.post(
+                url, headers=headers, data=body, stream=True,
+                timeout=(LLM_CONNECT_TIMEOUT, request_timeout)
+            )
             
             # 處理速率限制錯誤
             if response.status_code == 429:
-                retry_after = int(response.headers.get('Retry-After', retry_delay))
-                logger.warning(f"速率限制錯誤 (429)。將在 {retry_after} 秒後重試。嘗試 {attempt+1}/{max_retries}")
+                response.close()
+                # 伺服器指定的等待時間只向上加 0-20% 抖動，不早於其要求的時間重試；以 RETRY_MAX_DELAY 封頂
+                server_delay = min(int(response.headers.get('Retry-After', 0)), RETRY_MAX_DELAY)
+                retry_after = server_delay * random.uniform(1.0, 1.2) if server_delay else _backoff_delay(retry_delay)
+                if not retry_budget.take(retry_after):
+                    final_error = f"速率限制錯誤 (429)，重試等待時間已超過 {RETRY_BUDGET_SECONDS} 秒上限"
+                    logger.error(final_error)
+                    if progress_callback:
+                        progress_callback(final_error)
+                    return f"Error: {final_error}"
+                logger.warning(f"速率限制錯誤 (429)。將在 {retry_after:.1f} 秒後重試。嘗試 {attempt+1}/{max_retries}")
                 if progress_callback:
-                    progress_callback(f"速率限制錯誤 (429)。將在 {retry_after} 秒後重試...")
+                    progress_callback(f"速率限制錯誤 (429)。將在 {retry_after:.1f} 秒後重試...")
                 time.sleep(retry_after)
-                retry_delay *= 2
+                retry_delay = min(retry_delay * 2, RETRY_MAX_DELAY)
                 continue
                 
             if response.status_code != 200:
@@ -158,24 +580,24 @@ def generate_dialogue_via_requests(
                     progress_callback(f"API 錯誤: {response.status_code} {response.reason}")
             
             response.raise_for_status()
-            result = response.json()
-            generated_content = result['choices'][0]['message']['content']
+            with response:
+                generated_content, finish_reason = _read_streamed_completion(response, stream_callback, progress_callback)
+            if not generated_content:
+                # 空白回應視為失敗的嘗試並重試，不當成被截斷的內容送去分批生成
+                raise ValueError("API 返回空白內容")
             
             logger.info("API 請求成功，已收到回應")
             if progress_callback:
                 progress_callback("已成功從 LLM 獲取回應")
             
-            # 檢查內容是否被截斷（更精確的檢查方式）
-            content_lines = generated_content.strip().split('\n')
-            last_line = content_lines[-1] if content_lines else ""
+            # 檢查內容是否被截斷：只檢查結尾一小段，不必複製或分割整份內容
+            tail = generated_content[-TRUNCATION_TAIL_CHARS:].rstrip()
             
-            # 更精確的截斷檢測
+            # API 明確回報因長度上限而停止時直接判定為截斷，否則使用啟發式檢測
             is_truncated = (
+                finish_reason == "length" or
                 len(generated_content) < 2000 or  # 內容太短
-                not last_line.strip() or  # 最後一行為空
-                (last_line.startswith('speaker-') and len(last_line.split(':', 1)) > 1 and 
-                 len(last_line.split(':', 1)[1].strip()) < 10) or  # speaker 行內容太短
-                generated_content.strip().endswith(('在', '的', '了', '是', '會', '但', '因為', '所以', '這', '那'))
+                bool(_TRUNCATION_TAIL_PATTERN.search(tail))  # 句子未完或 speaker 行內容太短
             )
             
             # 如果原始輸入文本為空或太短，不進行分批生成
@@ -191,10 +613,12 @@ def generate_dialogue_via_requests(
                 # 如果內容被截斷，使用分批生成
                 full_content = _generate_in_batches(
                     pdf_text, base_prompt, headers, url, model, num_parts, 
-                    progress_callback, max_retries, retry_delay
+                    progress_callback, max_retries, RETRY_INITIAL_DELAY, request_timeout, retry_budget,
+                    stream_callback
                 )
                 if full_content:
                     generated_content = full_content
+                    is_truncated = False
                     logger.info("使用分批生成成功獲得完整內容")
                 else:
                     logger.warning("分批生成失敗，使用原始內容")
@@ -208,20 +632,39 @@ def generate_dialogue_via_requests(
                     progress_callback(f"品質檢查完成，分數: {quality_report.overall_score:.1f}/100")
             except Exception as e:
                 logger.warning(f"品質檢查失敗: {e}")
+
+            # 已知被截斷的內容不寫入快取，之後重新生成時仍會再次嘗試
+            if cache_file is not None and not is_truncated:
+                _write_dialogue_cache(cache_file, generated_content)
             
             return generated_content
             
-        except requests.exceptions.RequestException as e:
+        except requests.exceptions.Timeout as e:
+            # 逾時多為上游偶發的長尾延遲，立即重試而不增加等待時間
+            error_msg = f"請求逾時（{request_timeout} 秒）: {str(e)}"
+            logger.error(error_msg)
+            if attempt < max_retries - 1:
+                if progress_callback:
+                    progress_callback(f"{error_msg} 立即重試。嘗試 {attempt+1}/{max_retries}")
+                continue
+            final_error = f"在 {max_retries} 次嘗試後失敗: {str(e)}"
+            logger.error(final_error)
+            if progress_callback:
+                progress_callback(final_error)
+            return f"Error after {max_retries} attempts: {str(e)}"
+
+        except (requests.exceptions.RequestException, ValueError) as e:
             error_msg = f"請求失敗: {str(e)}"
             logger.error(error_msg)
             
-            if attempt < max_retries - 1:
-                retry_msg = f"將在 {retry_delay} 秒後重試。嘗試 {attempt+1}/{max_retries}"
+            delay = _backoff_delay(retry_delay)
+            if attempt < max_retries - 1 and retry_budget.take(delay):
+                retry_msg = f"將在 {delay:.1f} 秒後重試。嘗試 {attempt+1}/{max_retries}"
                 logger.info(retry_msg)
                 if progress_callback:
                     progress_callback(f"{error_msg} {retry_msg}")
-                time.sleep(retry_delay)
-                retry_delay *= 2
+                time.sleep(delay)
+                retry_delay = min(retry_delay * 2, RETRY_MAX_DELAY)
             else:
                 final_error = f"在 {max_retries} 次嘗試後失敗: {str(e)}"
                 logger.error(final_error)
@@ -306,8 +749,8 @@ def send_to_discord_webhook(webhook_url: str, script_content: str, summary_conte
                 try:
                     logger.info(f"嘗試發送到 Discord (第 {attempt + 1}/{max_retries} 次)")
                     
-                    # 發送請求，設置超時和重試
-                    response = requests.post(
+                    # 發送請求，設置超時和重試；使用共用 Session，重試時重用已建立的連線
+                    response = _SESSION.post(
                         webhook_url,
                         data=message_data,
                         files=files_to_send,
@@ -376,7 +819,8 @@ def generate_summary(
     llm_api_key: str,
     api_base: str,
     max_output_tokens: int = 4096,
-    progress_callback=None
+    progress_callback=None,
+    request_timeout: float = DEFAULT_REQUEST_TIMEOUT
 ) -> str:
     """
     為生成的腳本創建摘要
@@ -392,34 +836,24 @@ def generate_summary(
     except KeyError:
         return f"錯誤：未找到摘要模板 '{summary_type}'"
     
-    headers = {
-        "Authorization": f"Bearer {llm_api_key}",
-        "Content-Type": "application/json"
-    }
-    
-    base_url = api_base.rstrip("/")
-    url = f"{base_url}/chat/completions"
-    
-    payload = {
-        "model": model,
-        "messages": [
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ],
-        "temperature": 0.7,
-        "max_tokens": max_output_tokens
-    }
+    url, headers = _chat_endpoint(api_base, llm_api_key)
+    # 以串流接收摘要：讀取逾時只限制兩段內容之間的間隔，長篇摘要不會因整體生成時間超過逾時而失敗
+    payload = _chat_payload(model, prompt, get_max_output_tokens(summary_type, max_output_tokens), stream=True)
     
     if progress_callback:
         progress_callback(f"正在生成{summary_type}摘要...")
     
     try:
-        response = requests.post(url, headers=headers, json=payload)
-        response.raise_for_status()
-        result = response.json()
-        summary = result['choices'][0]['message']['content']
+        # 摘要不走回應快取，重新點擊「生成摘要」會重新生成
+        response = _SESSION.post(
+            url, headers=headers, data=orjson.dumps(payload), stream=True,
+            timeout=(LLM_CONNECT_TIMEOUT, request_timeout)
+        )
+        with response:
+            response.raise_for_status()
+            summary, _ = _read_streamed_completion(response, progress_callback=progress_callback)
+        if not summary:
+            raise ValueError("API 返回空白內容")
         
         logger.info(f"摘要生成完成，長度: {len(summary)} 字符")
         if progress_callback:
@@ -427,7 +861,7 @@ def generate_summary(
         
         return summary
         
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, ValueError) as e:
         error_msg = f"摘要生成失敗: {str(e)}"
         logger.error(error_msg)
         if progress_callback:
@@ -452,55 +886,19 @@ def handle_discord_share(webhook_url, script_content, summary_content):
         return gr.update(visible=True, value=result)
 
 
-def _generate_in_batches(pdf_text, base_prompt, headers, url, model, num_parts, progress_callback, max_retries, retry_delay):
+def _build_part_prompt(outline: str, part_index: int, num_parts: int, context_summary: str) -> str:
     """
-    分批生成的備用機制，只在單次生成被截斷時使用
-    """
-    try:
-        # 檢查輸入文本是否足夠
-        if not pdf_text or len(pdf_text.strip()) < 100:
-            logger.error("輸入文本為空或太短，無法進行分批生成")
-            return None
-            
-        logger.info(f"開始分批生成，共 {num_parts} 個部分")
-        
-        # 生成內容大綱（簡化版）
-        outline_prompt = f"""
-請為以下內容生成一個簡潔的討論大綱，包含 {num_parts} 個主要部分：
+    建立分批生成中單一部分的提示詞
 
-{pdf_text[:5000]}...
-
-請用繁體中文列出 {num_parts} 個主要討論主題，每個主題一行。
-"""
-        
-        # 獲取大綱
-        outline_payload = {
-            "model": model,
-            "messages": [{"role": "user", "content": outline_prompt}],
-            "temperature": 0.3,
-            "max_tokens": 1000
-        }
-        
-        outline_response = requests.post(url, headers=headers, json=outline_payload)
-        outline = ""
-        if outline_response.status_code == 200:
-            outline = outline_response.json()['choices'][0]['message']['content']
-            logger.info(f"獲得內容大綱: {outline[:100]}...")
-        
-        # 分批生成
-        dialogue_parts = []
-        context_summary = ""
-        
-        for part_index in range(num_parts):
-            is_first_part = part_index == 0
-            is_last_part = part_index == num_parts - 1
-            
-            if is_first_part:
-                part_prompt = f"""
-將以下內容轉換成播客對話的第 1/{num_parts} 部分：
+    完整內容來源由 _source_message 以系統訊息傳送，各部分（含第一部分）共用逐位元組相同的前綴，
+    第一部分的請求即寫入提示快取，之後的部分可重用已計算的內容。
+    """
+    if part_index == 0:
+        return f"""
+將內容來源轉換成播客對話的第 1/{num_parts} 部分：
 
 【內容來源】
-{pdf_text[:10000]}...
+見系統訊息
 
 【大綱參考】
 {outline}
@@ -513,8 +911,8 @@ def _generate_in_batches(pdf_text, base_prompt, headers, url, model, num_parts,
 - **不要結束對話**，在一個開放的討論點停止
 - 必須使用繁體中文，格式為 speaker-1: 和 speaker-2:
 """
-            elif is_last_part:
-                part_prompt = f"""
+    elif part_index == num_parts - 1:
+        return f"""
 延續之前的播客對話，這是第 {part_index+1}/{num_parts} 部分（最後一部分）。
 
 【前文摘要】
@@ -524,7 +922,7 @@ def _generate_in_batches(pdf_text, base_prompt, headers, url, model, num_parts,
 {outline}
 
 【內容來源】
-{pdf_text}
+見系統訊息
 
 請：
 1. **不要重複開場**，直接繼續前面的對話
@@ -534,8 +932,7 @@ def _generate_in_batches(pdf_text, base_prompt, headers, url, model, num_parts,
 
 **必須使用繁體中文，格式為 speaker-1: 和 speaker-2:**
 """
-            else:
-                part_prompt = f"""
+    return f"""
 延續之前的播客對話，這是第 {part_index+1}/{num_parts} 部分（中間部分）。
 
 【前文摘要】
@@ -545,7 +942,7 @@ def _generate_in_batches(pdf_text, base_prompt, headers, url, model, num_parts,
 {outline}
 
 【內容來源】
-{pdf_text}
+見系統訊息
 
 請：
 1. **不要重複開場**，直接繼續前面的對話
@@ -555,40 +952,238 @@ def _generate_in_batches(pdf_text, base_prompt, headers, url, model, num_parts,
 
 **必須使用繁體中文，格式為 speaker-1: 和 speaker-2:**
 """
+
+
+def _prompt_cache_key(url: str, pdf_text: str) -> Optional[str]:
+    """
+    以文件內容計算提示快取鍵，只對 PROMPT_CACHE_KEY_HOSTS 中的 API 返回
+
+    同一份文件的單次生成與分批生成使用相同的鍵，讓請求路由到保有相同前綴快取的伺服器。
+    """
+    if urlparse(url).hostname not in PROMPT_CACHE_KEY_HOSTS:
+        return None
+    return hashlib.sha256(pdf_text.encode("utf-8")).hexdigest()[:32]
+
+
+def _source_message(pdf_text: str) -> Dict[str, str]:
+    """各部分共用的內容來源系統訊息，內容必須逐位元組相同才能命中提示快取"""
+    return {"role": "system", "content": f"【內容來源】\n{pdf_text}"}
+
+
+def _outline_context(part_index: int) -> str:
+    """並行生成時，以大綱進度代替前一部分的內容作為前文摘要"""
+    return (
+        f"前面的部分已依照大綱討論了第 1 至第 {part_index} 個主題，"
+        f"本部分請接續討論第 {part_index+1} 個主題，不要重複前面主題的內容。"
+    )
+
+
+def _sequential_context(dialogue_parts: List[str], part_index: int, outline: str) -> str:
+    """逐部分生成時的前文摘要：已討論到的大綱位置，加上前一部分最後一段對話的原文"""
+    if not dialogue_parts:
+        return ""
+    recent = dialogue_parts[-1][-SEQUENTIAL_CONTEXT_TAIL_CHARS:]
+    if not outline:
+        return recent
+    return f"{_outline_context(part_index)}\n\n最近對話：\n{recent}"
+
+
+def _request_part(url, headers, model, part_prompt, part_index, num_parts, progress_callback, max_retries, retry_delay,
+                  request_timeout=DEFAULT_REQUEST_TIMEOUT, retry_budget=None, source_message=None, cache_key=None,
+                  first_token=None, cancel=None):
+    """
+    請求生成單一部分，失敗時重試
+
+    Args:
+        source_message: 放在使用者訊息之前的共用系統訊息（內容來源）
+        retry_budget: 與其他部分共用的重試等待預算，用盡時不再重試
+        cache_key: 提示快取鍵（見 _prompt_cache_key），為 None 時不傳送
+        first_token: 收到第一段生成內容（伺服器已處理完提示）或本函數返回時設定的 threading.Event
+        cancel: 設定後不再發起新的嘗試（其他部分已失敗）的 threading.Event
+
+    Returns:
+        Optional[str]: 生成的內容，全部嘗試失敗時返回 None
+    """
+    try:
+        return _request_part_attempts(
+            url, headers, model, part_prompt, part_index, num_parts, progress_callback, max_retries, retry_delay,
+            request_timeout, retry_budget, source_message, cache_key, first_token, cancel
+        )
+    finally:
+        # 不論成功、失敗或命中快取都設定，等待中的呼叫端不會卡住
+        if first_token is not None:
+            first_token.set()
+
+
+def _request_part_attempts(url, headers, model, part_prompt, part_index, num_parts, progress_callback, max_retries,
+                           retry_delay, request_timeout, retry_budget, source_message, cache_key, first_token, cancel):
+    """_request_part 的實際請求與重試流程"""
+    # 生成當前部分，使用更高的 token 限制；payload 只建立一次，重試時重用
+    # 以串流接收：讀取逾時只計算兩段資料之間的間隔，長篇生成不會因總耗時而逾時
+    part_payload = _chat_payload(model, part_prompt, 16384, stream=True)
+    if source_message is not None:
+        part_payload["messages"].insert(0, source_message)
+    if cache_key:
+        part_payload["prompt_cache_key"] = cache_key
+
+    # 啟用腳本快取時各部分也分別快取，中途失敗重新生成時已完成的部分不必再請求
+    part_cache_file = _dialogue_cache_file(url, part_payload, num_parts) if DIALOGUE_CACHE_ENABLED else None
+    cached_part = _read_dialogue_cache(part_cache_file) if part_cache_file is not None else None
+    if cached_part is not None:
+        return cached_part
+
+    # 請求本體只序列化一次，重試時重用；共用的內容來源訊息也不會在每次嘗試時重新編碼
+    part_body = orjson.dumps(part_payload)
+
+    for attempt in range(max_retries):
+        if cancel is not None and cancel.is_set():
+            logger.info(f"分批生成已中止，停止生成第 {part_index+1}/{num_parts} 部分")
+            return None
+        try:
+            if progress_callback:
+                progress_callback(f"生成第 {part_index+1}/{num_parts} 部分 (嘗試 {attempt+1})...")
+
+            part_response = _SESSION.post(
+                url, headers=headers, data=part_body, stream=True,
+                timeout=(LLM_CONNECT_TIMEOUT, request_timeout)
+            )
+            with part_response:
+                part_response.raise_for_status()
+                current_part, finish_reason = _read_streamed_completion(
+                    part_response,
+                    stream_callback=(lambda _delta: first_token.set()) if first_token is not None else None
+                )
+
+            if not current_part:
+                raise ValueError("API 返回空白內容")
+            if finish_reason == "length":
+                logger.warning(f"第 {part_index+1}/{num_parts} 部分達到輸出長度上限，內容可能不完整")
+            logger.info(f"完成第 {part_index+1}/{num_parts} 部分")
+            if part_cache_file is not None:
+                _write_dialogue_cache(part_cache_file, current_part)
+            return current_part
+
+        except Exception as e:
+            logger.error(f"生成第 {part_index+1} 部分失敗: {e}")
+            if attempt == max_retries - 1:
+                return None
+            # 逾時立即重試，其他錯誤以抖動退避等待後再試
+            if not isinstance(e, requests.exceptions.Timeout):
+                delay = _backoff_delay(retry_delay)
+                if retry_budget is not None and not retry_budget.take(delay):
+                    logger.error(f"第 {part_index+1} 部分重試等待時間已超過 {RETRY_BUDGET_SECONDS} 秒上限")
+                    return None
+                # 等待期間若分批生成已中止即提前結束
+                if cancel is None:
+                    time.sleep(delay)
+                elif cancel.wait(delay):
+                    return None
+                retry_delay = min(retry_delay * 2, RETRY_MAX_DELAY)
+
+    return None
+
+
+def _generate_in_batches(pdf_text, base_prompt, headers, url, model, num_parts, progress_callback, max_retries, retry_delay,
+                         request_timeout=DEFAULT_REQUEST_TIMEOUT, retry_budget=None, stream_callback=None):
+    """
+    分批生成的備用機制，只在單次生成被截斷時使用
+
+    BATCH_PARTS_CONCURRENCY > 1 時，各部分以大綱為共同上下文，第一部分開始輸出後其餘部分同時生成；
+    否則逐部分生成，並以前一部分的內容作為上下文。
+    提供 stream_callback 時，先清除介面上被截斷的內容，再依順序送出完成的部分。
+    """
+    try:
+        # 檢查輸入文本是否足夠
+        if not pdf_text or len(pdf_text.strip()) < 100:
+            logger.error("輸入文本為空或太短，無法進行分批生成")
+            return None
             
-            # 生成當前部分，使用更高的 token 限制
-            part_payload = {
-                "model": model,
-                "messages": [{"role": "user", "content": part_prompt}],
-                "temperature": 0.7,
-                "max_tokens": 16384  # 提高每部分的 token 限制
-            }
-            
-            for attempt in range(max_retries):
-                try:
-                    if progress_callback:
-                        progress_callback(f"生成第 {part_index+1}/{num_parts} 部分 (嘗試 {attempt+1})...")
-                    
-                    part_response = requests.post(url, headers=headers, json=part_payload)
-                    part_response.raise_for_status()
-                    
-                    current_part = part_response.json()['choices'][0]['message']['content']
-                    dialogue_parts.append(current_part)
-                    
-                    # 更新上下文摘要
-                    if context_summary:
-                        context_summary += "\n\n" + current_part
-                    else:
-                        context_summary = current_part
-                    
-                    logger.info(f"完成第 {part_index+1}/{num_parts} 部分")
-                    break
-                    
-                except Exception as e:
-                    logger.error(f"生成第 {part_index+1} 部分失敗: {e}")
-                    if attempt == max_retries - 1:
+        logger.info(f"開始分批生成，共 {num_parts} 個部分")
+        
+        # 生成內容大綱（簡化版）
+        outline_prompt = f"""
+請為以下內容生成一個簡潔的討論大綱，包含 {num_parts} 個主要部分：
+
+{pdf_text[:5000]}...
+
+請用繁體中文列出 {num_parts} 個主要討論主題，每個主題一行。
+"""
+        
+        # 獲取大綱
+        outline_payload = _chat_payload(model, outline_prompt, 1000, temperature=0.3)
+        
+        outline = ""
+        try:
+            outline = _chat_completion_cached(url, headers, outline_payload, request_timeout)
+            logger.info(f"獲得內容大綱: {outline[:100]}...")
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"獲取內容大綱失敗，不使用大綱繼續: {e}")
+        
+        # 分批生成；內容來源與快取鍵只計算一次，所有部分共用
+        request_args = (url, headers, model)
+        cache_key = _prompt_cache_key(url, pdf_text)
+        retry_args = (
+            progress_callback, max_retries, retry_delay, request_timeout,
+            retry_budget, _source_message(pdf_text), cache_key
+        )
+
+        def emit_part(part_index, part):
+            """依部分順序把完成的內容送到介面"""
+            if stream_callback:
+                if part_index == 0:
+                    stream_callback(None)
+                stream_callback(part if part_index == 0 else "\n\n" + part)
+
+        if BATCH_PARTS_CONCURRENCY > 1 and num_parts > 1 and outline:
+            # 先送出第一部分，收到其第一段內容（伺服器已處理並快取內容來源前綴）後，
+            # 再同時送出其餘部分，讓它們命中提示快取，而不是各自重新上傳並處理整份內容
+            logger.info(f"並行生成 {num_parts} 個部分")
+            first_token = threading.Event()
+            cancel = threading.Event()
+            # 不使用 with：其中一部分失敗時直接返回，不等待其餘仍在重試的部分完成
+            executor = cf.ThreadPoolExecutor(max_workers=min(BATCH_PARTS_CONCURRENCY, num_parts))
+            try:
+                futures = [
+                    executor.submit(
+                        _request_part, *request_args,
+                        _build_part_prompt(outline, 0, num_parts, _outline_context(0)),
+                        0, num_parts, *retry_args, first_token, cancel
+                    )
+                ]
+                first_token.wait()
+                if futures[0].done() and futures[0].result() is None:
+                    return None
+                futures += [
+                    executor.submit(
+                        _request_part, *request_args,
+                        _build_part_prompt(outline, part_index, num_parts, _outline_context(part_index)),
+                        part_index, num_parts, *retry_args, cancel=cancel
+                    )
+                    for part_index in range(1, num_parts)
+                ]
+                dialogue_parts = []
+                # 依順序等待各部分，前面的部分完成即可顯示，不必等全部完成
+                for part_index, future in enumerate(futures):
+                    part = future.result()
+                    if part is None:
                         return None
-                    time.sleep(retry_delay)
+                    dialogue_parts.append(part)
+                    emit_part(part_index, part)
+            finally:
+                # 成功時各部分皆已完成；失敗時取消尚未開始的部分，進行中的部分在下次嘗試前停止
+                cancel.set()
+                executor.shutdown(wait=False, cancel_futures=True)
+        else:
+            dialogue_parts = []
+            for part_index in range(num_parts):
+                # 以大綱進度加上前一部分的結尾作為上下文，不必每次合併並傳送所有先前的部分
+                context_summary = _sequential_context(dialogue_parts, part_index, outline)
+                part_prompt = _build_part_prompt(outline, part_index, num_parts, context_summary)
+                current_part = _request_part(*request_args, part_prompt, part_index, num_parts, *retry_args)
+                if current_part is None:
+                    return None
+                dialogue_parts.append(current_part)
+                emit_part(part_index, current_part)
         
         # 合併所有部分
         full_dialogue = "\n\n".join(dialogue_parts)
@@ -601,6 +1196,414 @@ def _generate_in_batches(pdf_text, base_prompt, headers, url, model, num_parts,
         return None
 
 
+def _extract_pdf_range(path: str, start: int, end: int) -> str:
+    """提取 PDF 指定頁碼範圍的文字（在子進程中執行，各自開啟文件）"""
+    import pymupdf
+
+    # 使用 PyMuPDF 預設的純文字旗標，與單進程提取的輸出一致
+    with pymupdf.open(path, filetype="pdf") as doc:
+        page_texts = (doc.load_page(i).get_text("text") for i in range(start, end))
+        return "\n\n".join(text for text in page_texts if text.strip())
+
+
+def _get_page_pool() -> cf.ProcessPoolExecutor:
+    """取得按頁段並行提取共用的進程池，第一次使用時才建立，之後的請求重用已啟動的子進程"""
+    global _PAGE_POOL
+    with _PAGE_POOL_LOCK:
+        if _PAGE_POOL is None:
+            _PAGE_POOL = cf.ProcessPoolExecutor(max_workers=PDF_PAGE_WORKERS)
+        return _PAGE_POOL
+
+
+def _submit_page_blocks(path: str, starts: List[int], ends: List[int]) -> List[cf.Future]:
+    """把各頁段的提取工作依頁序提交到共用進程池"""
+    global _PAGE_POOL
+    try:
+        executor = _get_page_pool()
+        return [executor.submit(_extract_pdf_range, path, start, end) for start, end in zip(starts, ends)]
+    except BrokenProcessPool:
+        # 子進程異常結束後進程池無法再使用，重建一次
+        logger.warning("頁段提取進程池已損壞，重新建立")
+        with _PAGE_POOL_LOCK:
+            _PAGE_POOL = None
+        executor = _get_page_pool()
+        return [executor.submit(_extract_pdf_range, path, start, end) for start, end in zip(starts, ends)]
+
+
+def _extract_pdf_pages_parallel(path: str, page_count: int, max_chars: Optional[int] = None) -> str:
+    """
+    將 PDF 切成連續頁段，由多個進程並行提取後依頁序合併
+
+    依頁序收集已完成的頁段，累積達到 max_chars 即取消尚未開始的頁段。
+    """
+    max_workers = PDF_PAGE_WORKERS
+    # 頁段數為進程數的 PDF_BLOCKS_PER_WORKER 倍：每段仍攤平開啟文件的成本，
+    # 且達到字數上限時還有尚未開始的頁段可以取消
+    block_size = -(-page_count // (max_workers * PDF_BLOCKS_PER_WORKER))
+    starts = list(range(0, page_count, block_size))
+    ends = [min(start + block_size, page_count) for start in starts]
+
+    logger.info(f"並行提取 PDF: {len(starts)} 個頁段，{max_workers} 個進程")
+    blocks: List[str] = []
+    collected = 0
+    futures = _submit_page_blocks(path, starts, ends)
+    for index, future in enumerate(futures):
+        block = future.result()
+        if block:
+            blocks.append(block)
+            collected += len(block)
+        if max_chars is not None and collected >= max_chars:
+            # 只取消本次提交且尚未開始的頁段，進程池保留給之後的請求
+            for pending in futures[index + 1:]:
+                pending.cancel()
+            logger.info(f"已達輸入長度上限 {max_chars} 字符，略過第 {ends[index] + 1} 頁之後的內容")
+            break
+    return "\n\n".join(blocks)
+
+
+def _extract_pdf_text_pdfium(path: str, max_chars: Optional[int] = None) -> str:
+    """以 pypdfium2 提取 PDF 文件的文字，達到 max_chars 即停止"""
+    import pypdfium2 as pdfium
+
+    logger.info(f"使用 pypdfium2 開啟 PDF: {path}")
+    page_texts: List[str] = []
+    collected = 0
+    pdf = pdfium.PdfDocument(path)
+    try:
+        for i in range(len(pdf)):
+            page = pdf[i]
+            textpage = page.get_textpage()
+            # PDFium 以 \r\n 分行，統一為 \n 與 PyMuPDF 的輸出一致
+            page_text = textpage.get_text_range().replace("\r\n", "\n")
+            textpage.close()
+            page.close()
+            if page_text.strip():  # 跳過空白頁（如掃描頁）
+                page_texts.append(page_text)
+                collected += len(page_text)
+            if max_chars is not None and collected >= max_chars:
+                logger.info(f"已達輸入長度上限 {max_chars} 字符，略過第 {i+2} 頁之後的內容")
+                break
+    finally:
+        pdf.close()
+
+    logger.info(f"PDF 處理完成: {path}")
+    return "\n\n".join(page_texts)
+
+
+def _extract_pdf_text(path: str, parallel_pages: bool = False, max_chars: Optional[int] = None) -> str:
+    """
+    提取 PDF 文件的文字
+
+    指定 max_chars 時，累積的文字達到上限即停止讀取後續頁面；
+    超出上限的內容之後反正會被截斷，不必解析。
+    PDF_PARSER 設為 pypdfium2 且已安裝時改用 pypdfium2（不使用按頁段並行）。
+    """
+    if PDF_PARSER == "pypdfium2":
+        try:
+            return _extract_pdf_text_pdfium(path, max_chars)
+        except ImportError:
+            logger.warning("未安裝 pypdfium2，改用 PyMuPDF")
+
+    import pymupdf
+
+    logger.info(f"使用 PyMuPDF 開啟 PDF: {path}")
+    # 使用 context manager，處理完立即釋放 MuPDF 的文件資源
+    with pymupdf.open(path, filetype="pdf") as doc:
+        page_count = len(doc)
+        logger.info(f"PDF 頁數: {page_count}")
+        use_parallel = parallel_pages and page_count >= PDF_PARALLEL_MIN_PAGES and PDF_PAGE_WORKERS > 1
+
+        page_texts: List[str] = []
+        collected = 0
+        if not use_parallel:
+            for i, page in enumerate(doc):
+                page_text = page.get_text("text")
+                if page_text.strip():  # 跳過空白頁（如掃描頁）
+                    page_texts.append(page_text)
+                    collected += len(page_text)
+                if i % 10 == 0:
+                    logger.debug(f"已處理 PDF 第 {i+1}/{page_count} 頁")
+                if max_chars is not None and collected >= max_chars:
+                    logger.info(f"已達輸入長度上限 {max_chars} 字符，略過第 {i+2} 頁之後的內容")
+                    break
+
+    if use_parallel:
+        text = _extract_pdf_pages_parallel(path, page_count, max_chars)
+    else:
+        text = "\n\n".join(page_texts)
+
+    logger.info(f"PDF 處理完成: {path}")
+    return text
+
+
+def _extract_txt_text(path: str, max_chars: Optional[int] = None) -> str:
+    """
+    提取文本文件的文字
+
+    指定 max_chars 時只讀取足以解碼出該字數的前段位元組（UTF-8 每字最多 4 位元組），
+    大型文本不必整份讀入記憶體。
+    """
+    logger.info(f"處理文本文件: {path}")
+    # 一次讀入位元組並單次解碼，略過文字模式的緩衝與增量解碼；換行統一為 \n，與文字模式讀取結果一致
+    if max_chars is None:
+        raw = Path(path).read_bytes()
+    else:
+        with open(path, "rb") as f:
+            # 多讀一個字的位元組，避免結尾被截斷的多位元組字元使字數少於上限
+            raw = f.read((max_chars + 1) * 4)
+    file_text = raw.decode("utf-8", errors="ignore")
+    file_text = file_text.replace("\r\n", "\n").replace("\r", "\n")
+    if max_chars is not None:
+        # 依最寬的位元組數讀取，ASCII 文字會多出數倍字數，截到上限再傳回主進程與寫入快取
+        file_text = file_text[:max_chars]
+    logger.info(f"文本文件處理完成，長度: {len(file_text)} 字符")
+    return file_text
+
+
+def _html_to_text(html) -> str:
+    """將 HTML 轉為純文字，優先使用 C 實作的 selectolax，否則使用 BeautifulSoup + lxml"""
+    # 文字節點之間不插入分隔符，<b>、<em> 等行內標籤不會把句子拆成多行
+    if HTMLParser is not None:
+        text = HTMLParser(html).text()
+    else:
+        from bs4 import BeautifulSoup
+
+        text = BeautifulSoup(html, 'lxml').get_text()
+    # 去除每行前後的 HTML 縮排並略過空行，段落仍依原始 HTML 的換行分隔
+    return "\n".join(line for line in (raw_line.strip() for raw_line in text.splitlines()) if line)
+
+
+def _epub_item_to_text(item) -> str:
+    """提取單一 EPUB 文檔項目的文字，失敗時返回空字串"""
+    try:
+        return _html_to_text(item.get_body_content())
+    except Exception as item_error:
+        logger.error(f"EPUB 項目處理錯誤: {item_error}")
+        return ""
+
+
+def _extract_epub_text(path: str, max_chars: Optional[int] = None) -> str:
+    """提取 EPUB 文件的文字，指定 max_chars 時累積達到上限即停止解析後續項目"""
+    import ebooklib
+    from ebooklib import epub
+
+    logger.info(f"處理 EPUB 文件: {path}")
+    item_texts: List[str] = []
+    book = epub.read_epub(path)
+    # 只取文檔類型項目，略過圖片、CSS、字型等資源
+    documents = list(book.get_items_of_type(ebooklib.ITEM_DOCUMENT))
+    item_count = len(documents)
+    processed_count = 0
+    total_chars = 0
+
+    # 如果沒有找到任何文檔項目，嘗試替代方法
+    if item_count == 0:
+        logger.warning(f"EPUB 文件沒有找到項目，嘗試替代處理方法: {path}")
+        # 嘗試直接讀取 spine 中的文檔
+        for spine_item in book.spine:
+            try:
+                item_id = spine_item[0]
+                item = book.get_item_by_id(item_id)
+                if item:
+                    item_text = _html_to_text(item.get_body_content())
+                    if item_text.strip():  # 只添加非空內容
+                        item_texts.append(item_text)
+                        processed_count += 1
+                        total_chars += len(item_text)
+            except Exception as spine_error:
+                logger.debug(f"處理 spine 項目失敗: {spine_error}")
+                continue
+            if max_chars is not None and total_chars >= max_chars:
+                logger.info(f"達到輸入長度上限 {max_chars}，停止解析")
+                break
+    else:
+        # 正常處理流程：文檔項目交給執行緒池並行解析，結果保持原順序
+        processed_count = item_count
+        with cf.ThreadPoolExecutor(max_workers=min(os.cpu_count() or 1, 8)) as executor:
+            for index, item_text in enumerate(executor.map(_epub_item_to_text, documents)):
+                if item_text.strip():  # 只添加非空內容
+                    item_texts.append(item_text)
+                    total_chars += len(item_text)
+                if max_chars is not None and total_chars >= max_chars:
+                    # 取消尚未開始的項目，已在執行的項目完成後即結束
+                    logger.info(f"達到輸入長度上限 {max_chars}，停止解析")
+                    processed_count = index + 1
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    break
+        logger.debug(f"已處理 EPUB 項目 {processed_count}/{item_count}")
+
+    # 合併文字前先釋放整本書（含圖片等資源）的記憶體
+    del book, documents
+
+    logger.info(f"EPUB 處理完成: {path}, 共處理 {processed_count} 個項目")
+    return "\n\n".join(item_texts)
+
+
+def _extract_one(path: str, parallel_pages: bool = False, max_chars: Optional[int] = None) -> str:
+    """
+    依副檔名提取單一文件的文字
+
+    此函數會在子進程中執行，因此只接收文件路徑（Gradio 文件物件無法 pickle）。
+    parallel_pages 僅在主進程中使用，避免子進程再建立進程池。
+    max_chars 為提取的字數上限，PDF 與 EPUB 達到上限即停止解析，TXT 只讀取所需的前段位元組。
+    """
+    suffix = os.path.splitext(path)[1].lower()
+    extractor = _EXTRACTORS.get(suffix)
+    if extractor is None:
+        raise ValueError(f"不支持的文件格式: {path}")
+    if suffix == ".pdf":
+        return extractor(path, parallel_pages, max_chars)
+    return extractor(path, max_chars)
+
+
+# 副檔名到提取函數的對應表，新增格式只需在此註冊
+_EXTRACTORS = {
+    ".pdf": _extract_pdf_text,
+    ".txt": _extract_txt_text,
+    ".epub": _extract_epub_text,
+}
+
+
+def _file_sha256(path: str) -> str:
+    """以記憶體映射計算文件內容的 SHA-256，不把整個文件複製到 Python 物件中"""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:  # 空文件無法映射
+            return hashlib.sha256().hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return hashlib.sha256(mm).hexdigest()
+
+
+@functools.lru_cache(maxsize=64)
+def _file_sha256_for_stat(path: str, mtime_ns: int, size: int) -> str:
+    """以 (路徑, 修改時間, 大小) 記住文件雜湊；同一上傳文件重新生成時不必再讀取整個文件"""
+    return _file_sha256(path)
+
+
+def _file_digest(path: str) -> str:
+    """返回文件內容的 SHA-256，文件未變更時直接使用先前計算的結果"""
+    stat = os.stat(path)
+    return _file_sha256_for_stat(path, stat.st_mtime_ns, stat.st_size)
+
+
+def _extraction_cache_stem(path: str) -> str:
+    """提取快取的檔名主體：文件內容雜湊結合 PDF 解析器與提取版本，任一項改變都不會誤用舊結果"""
+    key = hashlib.blake2b(_file_digest(path).encode("utf-8"), digest_size=16)
+    key.update(f"\0{PDF_PARSER}\0{EXTRACTION_CACHE_VERSION}".encode("utf-8"))
+    return key.hexdigest()
+
+
+def _evict_extraction_cache() -> None:
+    """快取文件超過上限時，依最後使用時間刪除最舊的項目"""
+    try:
+        entries = sorted(EXTRACTION_CACHE_DIR.glob("*.txt"), key=lambda p: p.stat().st_mtime)
+        for entry in entries[:-EXTRACTION_CACHE_MAX_FILES]:
+            entry.unlink(missing_ok=True)
+    except OSError as e:
+        logger.debug(f"清理提取快取失敗: {e}")
+
+
+def _extract_cached(path: str, parallel_pages: bool = False, max_chars: Optional[int] = None) -> str:
+    """
+    帶快取的文件提取
+
+    以文件內容雜湊、PDF 解析器與提取版本查找磁碟快取，命中時直接返回；否則提取後以原子替換方式寫入快取。
+    因 max_chars 提前停止的結果另以上限值區分快取鍵，不會被當成完整內容使用。
+    EXTRACTION_CACHE_ENABLED 為 False 時直接提取，不讀寫磁碟快取。
+    """
+    if not EXTRACTION_CACHE_ENABLED:
+        return _extract_one(path, parallel_pages, max_chars)
+
+    stem = _extraction_cache_stem(path)
+    full_cache_file = EXTRACTION_CACHE_DIR / f"{stem}.txt"
+    candidates = [full_cache_file]
+    if max_chars is not None:
+        candidates.append(EXTRACTION_CACHE_DIR / f"{stem}.{max_chars}.txt")
+    for cache_file in candidates:
+        try:
+            text = cache_file.read_text(encoding="utf-8")
+            os.utime(cache_file)  # 更新最後使用時間，供淘汰時參考
+            logger.info(f"命中提取快取: {path}")
+            return text
+        except OSError:
+            pass
+
+    text = _extract_one(path, parallel_pages, max_chars)
+    cache_file = candidates[-1] if max_chars is not None and len(text) >= max_chars else full_cache_file
+
+    try:
+        EXTRACTION_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=EXTRACTION_CACHE_DIR, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, cache_file)
+        _evict_extraction_cache()
+    except OSError as e:
+        logger.warning(f"寫入提取快取失敗: {e}")
+
+    return text
+
+
+def _get_extraction_pool() -> cf.ProcessPoolExecutor:
+    """取得共用的提取進程池，第一次使用時才建立，之後的請求重用已啟動的子進程"""
+    global _EXTRACTION_POOL
+    with _EXTRACTION_POOL_LOCK:
+        if _EXTRACTION_POOL is None:
+            _EXTRACTION_POOL = cf.ProcessPoolExecutor(max_workers=PDF_LOAD_WORKERS)
+        return _EXTRACTION_POOL
+
+
+def _submit_extractions(paths: List[str], max_chars: int) -> Dict[cf.Future, int]:
+    """把各文件的提取工作提交到共用進程池，返回 future 到上傳順序的對應"""
+    global _EXTRACTION_POOL
+    try:
+        executor = _get_extraction_pool()
+        return {executor.submit(_extract_cached, path, False, max_chars): index for index, path in enumerate(paths)}
+    except BrokenProcessPool:
+        # 子進程異常結束後進程池無法再使用，重建一次
+        logger.warning("提取進程池已損壞，重新建立")
+        with _EXTRACTION_POOL_LOCK:
+            _EXTRACTION_POOL = None
+        executor = _get_extraction_pool()
+        return {executor.submit(_extract_cached, path, False, max_chars): index for index, path in enumerate(paths)}
+
+
+def _collected_length(results: List[Optional[str]]) -> int:
+    """已提取完成的文字總長度"""
+    return sum(len(text) for text in results if text is not None)
+
+
+def _join_within_budget(texts: List[Optional[str]], budget: int, separator: str = "\n\n") -> str:
+    """依順序以分隔符合併文字，總長度達到 budget 後略過其餘文字，結果與完整合併後截斷相同"""
+    parts: List[str] = []
+    total = 0
+    for text in texts:
+        if text is None:
+            continue
+        if parts:
+            total += len(separator)
+        parts.append(text)
+        total += len(text)
+        if total >= budget:
+            break
+    combined = separator.join(parts)
+    return combined[:budget] if len(combined) > budget else combined
+
+
+def _extraction_error_messages(path: str, error: Exception) -> List[str]:
+    """依文件類型生成提取失敗時的錯誤訊息"""
+    filename = path.lower()
+    suffix = os.path.splitext(filename)[1]
+    if suffix == ".pdf":
+        return [f"PDF 處理錯誤 ({filename}): {str(error)}"]
+    elif suffix == ".txt":
+        return [f"TXT 文件處理錯誤 ({filename}): {str(error)}"]
+    # 提供 EPUB 處理失敗的具體建議
+    return [
+        f"EPUB 處理錯誤 ({filename}): {str(error)}",
+        "建議：1) 檢查 EPUB 文件是否完整；2) 嘗試用其他工具轉換為 PDF 或 TXT 格式後重新上傳"
+    ]
+
+
 def validate_and_generate_script(
     files,
     openai_api_key,
@@ -611,7 +1614,9 @@ def validate_and_generate_script(
     num_parts=3,
     max_input_length=1000000,
     max_output_tokens=65536,
-    progress_callback=None
+    request_timeout=DEFAULT_REQUEST_TIMEOUT,
+    progress_callback=None,
+    stream_callback=None
 ):
     """驗證輸入並生成腳本"""
     if not files:
@@ -624,118 +1629,70 @@ def validate_and_generate_script(
         logger.info(f"開始處理 {len(files)} 個文件")
         if progress_callback:
             progress_callback(f"開始處理 {len(files)} 個文件...")
-        
-        # 從檔案中提取文字
-        combined_text = ""
+
+        # 篩選支持的文件格式，只傳遞路徑給子進程
+        # 每個文件的小寫名稱、副檔名與顯示名稱只計算一次
+        paths = []
         for file in files:
             filename = file.name.lower()
-            logger.info(f"處理文件: {filename}")
-            if progress_callback:
-                progress_callback(f"處理文件: {os.path.basename(filename)}")
+            display_name = os.path.basename(file.name)
+            if os.path.splitext(filename)[1] in _EXTRACTORS:
+                paths.append(file.name)
+                logger.info(f"處理文件: {filename}")
+                if progress_callback:
+                    progress_callback(f"處理文件: {display_name}")
+            else:
+                logger.warning(f"跳過不支持的文件格式: {filename}")
+                if progress_callback:
+                    progress_callback(f"跳過不支持的文件格式: {display_name}")
 
-            if filename.endswith(".pdf"):
-                try:
-                    logger.info(f"使用 PyMuPDF 開啟 PDF: {filename}")
-                    doc = pymupdf.open(file.name)
-                    page_count = len(doc)
-                    logger.info(f"PDF 頁數: {page_count}")
-                    
-                    for i, page in enumerate(doc):
-                        page_text = page.get_text()
-                        combined_text += page_text + "\n\n"
-                        if i % 10 == 0:
-                            logger.debug(f"已處理 PDF 第 {i+1}/{page_count} 頁")
-                            if progress_callback and page_count > 10:
-                                progress_callback(f"處理 PDF: {os.path.basename(filename)} - {i+1}/{page_count} 頁")
-                    
-                    logger.info(f"PDF 處理完成: {filename}")
-                    if progress_callback:
-                        progress_callback(f"PDF 處理完成: {os.path.basename(filename)}")
-                except Exception as e:
-                    error_msg = f"PDF 處理錯誤 ({filename}): {str(e)}"
-                    logger.error(error_msg)
-                    if progress_callback:
-                        progress_callback(error_msg)
+        # 提取文字期間先在背景建立到 LLM 端點的連線，與文件解析重疊
+        if api_base_value:
+            threading.Thread(target=_warm_up_connection, args=(api_base_value,), daemon=True).start()
 
-            elif filename.endswith(".txt"):
-                try:
-                    logger.info(f"處理文本文件: {filename}")
-                    with open(file.name, "r", encoding="utf-8", errors="ignore") as f:
-                        file_text = f.read()
-                        combined_text += file_text + "\n\n"
-                        logger.info(f"文本文件處理完成，長度: {len(file_text)} 字符")
-                        if progress_callback:
-                            progress_callback(f"文本文件處理完成: {os.path.basename(filename)}")
-                except Exception as e:
-                    error_msg = f"TXT 文件處理錯誤 ({filename}): {str(e)}"
-                    logger.error(error_msg)
-                    if progress_callback:
-                        progress_callback(error_msg)
+        # 從檔案中提取文字，每個文件在獨立進程中處理以繞過 GIL
+        results = [None] * len(paths)
 
-            elif filename.endswith(".epub"):
-                try:
-                    logger.info(f"處理 EPUB 文件: {filename}")
-                    if progress_callback:
-                        progress_callback(f"處理 EPUB 文件: {os.path.basename(filename)}")
-                    
-                    book = epub.read_epub(file.name)
-                    items = list(book.get_items())
-                    item_count = len(items)
-                    processed_count = 0
-                    
-                    # 如果沒有找到任何項目，嘗試替代方法
-                    if item_count == 0:
-                        logger.warning(f"EPUB 文件沒有找到項目，嘗試替代處理方法: {filename}")
-                        # 嘗試直接讀取 spine 中的文檔
-                        for spine_item in book.spine:
-                            try:
-                                item_id = spine_item[0]
-                                item = book.get_item_by_id(item_id)
-                                if item:
-                                    soup = BeautifulSoup(item.get_body_content(), 'html.parser')
-                                    item_text = soup.get_text()
-                                    if item_text.strip():  # 只添加非空內容
-                                        combined_text += item_text + "\n\n"
-                                        processed_count += 1
-                            except Exception as spine_error:
-                                logger.debug(f"處理 spine 項目失敗: {spine_error}")
-                                continue
-                    else:
-                        # 正常處理流程
-                        for item in items:
-                            if item.get_type() == ebooklib.ITEM_DOCUMENT:
-                                try:
-                                    processed_count += 1
-                                    soup = BeautifulSoup(item.get_body_content(), 'html.parser')
-                                    item_text = soup.get_text()
-                                    if item_text.strip():  # 只添加非空內容
-                                        combined_text += item_text + "\n\n"
-                                    
-                                    logger.debug(f"已處理 EPUB 項目 {processed_count}/{item_count}")
-                                    if processed_count % 5 == 0 and progress_callback:
-                                        progress_callback(f"處理 EPUB: {os.path.basename(filename)} - {processed_count}/{item_count} 項目")
-                                except Exception as item_error:
-                                    logger.error(f"EPUB 項目處理錯誤: {item_error}")
-                                    continue
-                    
-                    logger.info(f"EPUB 處理完成: {filename}, 共處理 {processed_count} 個項目")
-                    if progress_callback:
-                        progress_callback(f"EPUB 處理完成: {os.path.basename(filename)}, 共處理 {processed_count} 個項目")
-                except Exception as e:
-                    error_msg = f"EPUB 處理錯誤 ({filename}): {str(e)}"
+        def collect_result(index, extract):
+            """收集單一文件的提取結果，單一文件失敗不影響其他文件"""
+            path = paths[index]
+            try:
+                results[index] = extract()
+                if progress_callback:
+                    progress_callback(f"文件處理完成: {os.path.basename(path)}")
+            except Exception as e:
+                for error_msg in _extraction_error_messages(path, e):
                     logger.error(error_msg)
                     if progress_callback:
                         progress_callback(error_msg)
-                    
-                    # 提供 EPUB 處理失敗的具體建議
-                    suggestion = "建議：1) 檢查 EPUB 文件是否完整；2) 嘗試用其他工具轉換為 PDF 或 TXT 格式後重新上傳"
-                    logger.info(suggestion)
-                    if progress_callback:
-                        progress_callback(suggestion)
-            else:
-                logger.warning(f"跳過不支持的文件格式: {filename}")
-                if progress_callback:
-                    progress_callback(f"跳過不支持的文件格式: {os.path.basename(filename)}")
+
+        if len(paths) == 1:
+            # 單一文件直接在主進程處理，大型 PDF 改為按頁段並行提取
+            collect_result(0, lambda: _extract_cached(paths[0], parallel_pages=True, max_chars=max_input_length))
+        elif paths and PDF_LOAD_WORKERS <= 1:
+            # 關閉並行時逐一在主進程處理，已提取的文字達到輸入上限後略過其餘文件
+            for index, path in enumerate(paths):
+                if _collected_length(results) >= max_input_length:
+                    logger.info(f"達到輸入長度上限 {max_input_length}，略過其餘 {len(paths) - index} 個文件")
+                    break
+                collect_result(index, lambda: _extract_cached(path, max_chars=max_input_length))
+        elif paths:
+            futures = _submit_extractions(paths, max_input_length)
+            # 文件一完成就回報進度，合併時仍依上傳順序
+            for future in cf.as_completed(futures):
+                if future.cancelled():
+                    continue
+                collect_result(futures[future], future.result)
+                # 進程池依提交順序啟動，尚未開始的文件都排在已啟動的文件之後，
+                # 已完成的文字達到上限時取消它們不會影響合併後的前 max_input_length 字符
+                if _collected_length(results) >= max_input_length:
+                    cancelled = sum(f.cancel() for f in futures)
+                    if cancelled:
+                        logger.info(f"達到輸入長度上限 {max_input_length}，取消其餘 {cancelled} 個文件")
+
+        # 只合併輸入上限內的文字，不先建立完整的合併字串再截斷
+        combined_text = _join_within_budget(results, max_input_length)
+        del results
 
         text_length = len(combined_text)
         logger.info(f"所有文件處理完成，合併文本長度: {text_length} 字符")
@@ -765,7 +1722,9 @@ def validate_and_generate_script(
             max_input_length=max_input_length,
             max_output_tokens=max_output_tokens,
             progress_callback=progress_callback,
-            template_type=template_type
+            template_type=template_type,
+            stream_callback=stream_callback,
+            request_timeout=request_timeout
         )
 
         logger.info("腳本生成完成")
@@ -879,6 +1838,16 @@ with gr.Blocks(title="Script Generator", css="""
                 info="調整模型最大輸出 token 數。Gemini Flash 2.5: 65536, GPT-4: 4096, Claude: 8192"
             )
             
+            # 添加請求逾時秒數的滑動條
+            request_timeout_slider = gr.Slider(
+                minimum=5,
+                maximum=300,
+                value=DEFAULT_REQUEST_TIMEOUT,
+                step=5,
+                label="請求逾時秒數 | Request Timeout (s)",
+                info="串流接收 LLM 回應時，兩段內容之間的最長等待秒數；生成腳本時逾時會立即重試"
+            )
+            
         
         with gr.Column(scale=1):
             # 輸出區
@@ -945,13 +1914,17 @@ with gr.Blocks(title="Script Generator", css="""
             logger.warning("未提供 API 密鑰")
             return gr.update(choices=[], value=None), gr.update(visible=True, value="錯誤: 需要 API 密鑰")
         
-        models = fetch_models(key, base)
+        try:
+            models = fetch_models(key, base)
+        except ApiError as e:
+            models, error_msg = [], str(e)
+        else:
+            error_msg = "未知錯誤"
         
-        if isinstance(models, list) and models and not models[0].startswith("Error"):
+        if models:
             logger.info(f"成功獲取 {len(models)} 個模型")
             return gr.update(choices=models, value=models[0]), gr.update(visible=False)
         
-        error_msg = models[0] if models else "未知錯誤"
         logger.error(f"獲取模型失敗: {error_msg}")
         return gr.update(choices=[], value=None), gr.update(visible=True, value=error_msg)
     
@@ -965,28 +1938,77 @@ with gr.Blocks(title="Script Generator", css="""
             logger.error(f"模板 {template} 不存在")
             return "錯誤：模板不存在"
     
+    def handle_connection_warm_up(api_base_val):
+        # 在背景預先建立連線，使用者按下生成時可重用已完成握手的連線
+        if api_base_val and api_base_val.strip():
+            threading.Thread(target=_warm_up_connection, args=(api_base_val.strip(),), daemon=True).start()
+
     fetch_button.click(
         fn=handle_model_fetch,
         inputs=[api_key, api_base],
         outputs=[model_dropdown, error_output]
     )
+
+    # 頁面載入及修改 API Base URL 後預熱連線；使用 blur 而非 change，避免每次按鍵都發出請求
+    demo.load(fn=handle_connection_warm_up, inputs=[api_base], queue=False)
+    api_base.blur(fn=handle_connection_warm_up, inputs=[api_base], queue=False)
     
+    # 模板預覽只是拼接預先編譯的模板片段，不需排隊等待 worker
     template_dropdown.change(
         fn=update_template,
         inputs=[template_dropdown],
-        outputs=[dialog]
+        outputs=[dialog],
+        queue=False
     )
     
     def handle_script_generation(*args):
         logger.info("開始生成腳本")
-        script, error = validate_and_generate_script(*args)
+        # 在背景執行緒生成腳本，串流內容經由佇列即時顯示到介面
+        updates = queue.Queue()
+        done = object()
+        result = {}
+
+        def worker():
+            try:
+                result["value"] = validate_and_generate_script(*args, stream_callback=updates.put)
+            finally:
+                updates.put(done)
+
+        threading.Thread(target=worker, daemon=True).start()
+
+        chunks = []
+        finished = False
+        last_update = 0.0
+        while not finished:
+            # 取出 UI_UPDATE_INTERVAL 內到達的所有內容，合併成一次介面更新
+            items = [updates.get()]
+            deadline = last_update + UI_UPDATE_INTERVAL
+            while items[-1] is not done:
+                remaining = deadline - time.monotonic()
+                try:
+                    items.append(updates.get(timeout=remaining) if remaining > 0 else updates.get_nowait())
+                except queue.Empty:
+                    break
+            for item in items:
+                if item is done:
+                    finished = True
+                elif item is None:  # 重試，捨棄先前的部分內容
+                    chunks.clear()
+                else:
+                    chunks.append(item)
+            if chunks and not finished:
+                yield "".join(chunks), gr.update(visible=False)
+                last_update = time.monotonic()
+
+        script, error = result.get("value", (None, "腳本生成過程中發生未知錯誤"))
         if error:
             logger.error(f"腳本生成失敗: {error}")
-            return None, gr.update(visible=True, value=error)
+            yield None, gr.update(visible=True, value=error)
+            return
         logger.info("腳本生成成功")
-        return script, gr.update(visible=False)
+        yield script, gr.update(visible=False)
     
-    def handle_summary_generation(script_content, summary_type, api_key_val, model_val, api_base_val, max_tokens_val):
+    def handle_summary_generation(script_content, summary_type, api_key_val, model_val, api_base_val, max_tokens_val, timeout_val):
         if not script_content or not script_content.strip():
             return "錯誤：請先生成腳本內容"
         
@@ -1005,7 +2027,8 @@ with gr.Blocks(title="Script Generator", css="""
             llm_api_key=api_key_val,
             api_base=api_base_val,
             max_output_tokens=max_tokens_val // 2,  # 摘要使用較少的 tokens
-            progress_callback=progress_callback
+            progress_callback=progress_callback,
+            request_timeout=timeout_val
         )
         
         return summary
@@ -1021,9 +2044,11 @@ with gr.Blocks(title="Script Generator", css="""
             custom_prompt,  # user_feedback
             num_parts_slider,  # 添加滑動條參數
             max_input_length_slider,  # 添加最大輸入文本長度參數
-            max_output_tokens_slider  # 添加最大輸出 token 數參數
+            max_output_tokens_slider,  # 添加最大輸出 token 數參數
+            request_timeout_slider  # 請求逾時秒數
         ],
-        outputs=[output_text, error_output]
+        outputs=[output_text, error_output],
+        concurrency_limit=2  # 限制同時進行的腳本生成，避免佔滿 LLM 配額與 CPU
     )
     
     generate_summary_button.click(
@@ -1034,7 +2059,8 @@ with gr.Blocks(title="Script Generator", css="""
             api_key,  # API 金鑰
             model_dropdown,  # 模型
             api_base,  # API 基礎 URL
-            max_output_tokens_slider  # 最大輸出 tokens
+            max_output_tokens_slider,  # 最大輸出 tokens
+            request_timeout_slider  # 請求逾時秒數
         ],
         outputs=[summary_output]
     )
@@ -1050,7 +2076,8 @@ with gr.Blocks(title="Script Generator", css="""
     )
 
 
-app = demo.queue()
+# 限制同時處理的請求數，長時間的生成任務不會阻塞其他操作
+app = demo.queue(default_concurrency_limit=4, max_size=32)
 
 if __name__ == "__main__":
     logger.info("啟動腳本生成器應用 (重構版)")
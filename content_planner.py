@@ -7,14 +7,43 @@ Content Planning Module
 """
 
 import re
+import hashlib
+import itertools
 import logging
+import threading
 from typing import List, Dict, Tuple, Optional
 from dataclasses import dataclass
-from collections import Counter
+from collections import Counter, OrderedDict
+from heapq import nlargest
+from operator import itemgetter
 
 logger = logging.getLogger(__name__)
 
-@dataclass
+# analyze_content 結果快取的最大筆數，超過時淘汰最早加入的項目
+ANALYSIS_CACHE_MAX_ENTRIES = 8
+
+# 每輪對話最多對應的段落數；超長文本的段落超過 目標輪數 × 此值 時，合併相鄰段落
+MAX_PARAGRAPHS_PER_ROUND = 2
+
+# 短於此字數的文本不做關鍵詞與主題分析，直接視為單一片段
+SMALL_TEXT_THRESHOLD = 5000
+
+# 一次掃描同時取得中文詞彙、句末標點與各類專業術語，避免對全文做多次 findall
+_TEXT_SCANNER = re.compile(
+    r'(?P<cjk>[\u4e00-\u9fff]+)'
+    r'|(?P<sentend>[。！？])'
+    r'|(?P<term>[A-Z]{2,}'             # 縮寫
+    r'|\d+\.?\d*%'                    # 百分比
+    r'|\d+\.?\d*[A-Za-z]+'            # 帶單位的數字
+    r'|[a-zA-Z]+tion'                  # -tion結尾的詞
+    r'|[a-zA-Z]+ism)'                  # -ism結尾的詞
+)
+
+# 編號標題（如「1.」或「一、」）與編號列表項（如「1)」）
+_NUMBERED_HEADER_RE = re.compile(r'\d+\.|[一二三四五六七八九十]+、')
+_NUMBERED_LIST_RE = re.compile(r'\d+\)')
+
+@dataclass(slots=True)
 class ContentSegment:
     """內容片段"""
     title: str
@@ -24,7 +53,7 @@ class ContentSegment:
     priority: int  # 1-10, 10為最重要
 
 
-@dataclass
+@dataclass(slots=True)
 class ContentOutline:
     """內容大綱"""
     main_topic: str
@@ -37,12 +66,16 @@ class ContentAnalyzer:
     """內容分析器"""
     
     def __init__(self):
-        self.stopwords = {
+        self.stopwords = frozenset({
             '的', '了', '和', '是', '在', '有', '這', '個', '一', '我', '你', '他',
             '她', '它', '們', '我們', '你們', '他們', '也', '都', '很', '更', '最',
             '可以', '能夠', '應該', '需要', '必須', '會', '將', '要', '來', '去',
             '說', '講', '談', '看', '聽', '想', '覺得', '認為', '以為', '知道'
-        }
+        })
+        # 文本雜湊 -> 分析結果，同一份內容重新生成時免去重複掃描；
+        # 分析器可能由多個生成請求共用，讀寫快取時需持有鎖
+        self._analysis_cache: "OrderedDict[str, Dict[str, any]]" = OrderedDict()
+        self._analysis_cache_lock = threading.Lock()
     
     def analyze_content(self, text: str) -> Dict[str, any]:
         """
@@ -52,16 +85,26 @@ class ContentAnalyzer:
             text: 輸入文本
             
         Returns:
-            Dict: 分析結果
+            Dict: 分析結果（相同文本返回同一個快取物件，請勿修改）
         """
+        cache_key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+        with self._analysis_cache_lock:
+            cached = self._analysis_cache.get(cache_key)
+        if cached is not None:
+            logger.info("使用快取的內容分析結果")
+            return cached
+
         logger.info("開始分析文本內容")
         
         # 基本統計
         word_count = len(text)
         paragraph_count = len([p for p in text.split('\n\n') if p.strip()])
         
+        # 單次掃描全文
+        words, length_variance, technical_terms = self._scan_text(text)
+        
         # 提取關鍵詞
-        keywords = self._extract_keywords(text)
+        keywords = self._extract_keywords(words)
         
         # 識別主題
         main_topics = self._identify_main_topics(text, keywords)
@@ -79,20 +122,66 @@ class ContentAnalyzer:
             'main_topics': main_topics,
             'structure': structure,
             'estimated_rounds': estimated_rounds,
-            'complexity_score': self._calculate_complexity(text)
+            'complexity_score': self._calculate_complexity(words, length_variance, technical_terms)
         }
         
         logger.info(f"內容分析完成：{word_count}字，{paragraph_count}段落，{len(keywords)}個關鍵詞")
+
+        with self._analysis_cache_lock:
+            self._analysis_cache[cache_key] = result
+            while len(self._analysis_cache) > ANALYSIS_CACHE_MAX_ENTRIES:
+                self._analysis_cache.popitem(last=False)
         return result
     
-    def _extract_keywords(self, text: str, top_k: int = 50) -> List[str]:
+    def _scan_text(self, text: str) -> Tuple[List[str], Optional[float], int]:
+        """
+        單次掃描全文
+        
+        句子長度的變異數以 Welford 演算法邊掃描邊累計，不保留各句長度。
+        
+        Returns:
+            Tuple: (中文詞彙列表, 句子長度變異數（無句子時為 None）, 專業術語數量)
+        """
+        words = []
+        technical_terms = 0
+        sentence_start = 0
+        sentence_count = 0
+        mean_length = 0.0
+        squared_deviation = 0.0
+        
+        # 以 None 標記文末，讓最後一句與其他句子走同一段累計邏輯
+        for match in itertools.chain(_TEXT_SCANNER.finditer(text), (None,)):
+            if match is None:
+                sentence = text[sentence_start:]
+            elif match.lastgroup == 'cjk':
+                words.append(match.group())
+                continue
+            elif match.lastgroup == 'term':
+                technical_terms += 1
+                continue
+            else:
+                sentence = text[sentence_start:match.start()]
+                sentence_start = match.end()
+            
+            length = len(sentence.strip())
+            if length:
+                sentence_count += 1
+                delta = length - mean_length
+                mean_length += delta / sentence_count
+                squared_deviation += delta * (length - mean_length)
+        
+        length_variance = squared_deviation / sentence_count if sentence_count else None
+        return words, length_variance, technical_terms
+    
+    def _extract_keywords(self, words: List[str], top_k: int = 50) -> List[str]:
         """提取關鍵詞"""
         # 簡單的關鍵詞提取（基於詞頻）
-        words = re.findall(r'[\u4e00-\u9fff]+', text)  # 提取中文詞彙
-        words = [word for word in words if len(word) >= 2 and word not in self.stopwords]
+        stopwords = self.stopwords
+        words = [word for word in words if len(word) >= 2 and word not in stopwords]
         
         word_freq = Counter(words)
-        return [word for word, freq in word_freq.most_common(top_k)]
+        # 只需前 top_k 個，用堆取代整表排序
+        return [word for word, _ in nlargest(top_k, word_freq.items(), key=itemgetter(1))]
     
     def _identify_main_topics(self, text: str, keywords: List[str]) -> List[str]:
         """識別主要主題"""
@@ -119,11 +208,15 @@ class ContentAnalyzer:
     
     def _analyze_structure(self, text: str) -> Dict[str, int]:
         """分析文本結構"""
-        lines = text.split('\n')
-        
-        # 計算不同類型的內容
-        headers = len([line for line in lines if self._is_header(line)])
-        lists = len([line for line in lines if self._is_list_item(line)])
+        # 計算不同類型的內容，每行只去除空白一次
+        headers = 0
+        lists = 0
+        for line in text.split('\n'):
+            line = line.strip()
+            if self._is_header(line):
+                headers += 1
+            if self._is_list_item(line):
+                lists += 1
         tables = text.count('|')  # 簡單的表格檢測
         
         return {
@@ -134,20 +227,17 @@ class ContentAnalyzer:
         }
     
     def _is_header(self, line: str) -> bool:
-        """判斷是否為標題行"""
-        line = line.strip()
+        """判斷是否為標題行（line 需已去除首尾空白）"""
         return (line.startswith('#') or 
                 (len(line) < 50 and line.endswith('：')) or
-                re.match(r'^\d+\.', line) or
-                re.match(r'^[一二三四五六七八九十]+、', line))
+                _NUMBERED_HEADER_RE.match(line))
     
     def _is_list_item(self, line: str) -> bool:
-        """判斷是否為列表項"""
-        line = line.strip()
+        """判斷是否為列表項（line 需已去除首尾空白）"""
         return (line.startswith('•') or 
                 line.startswith('-') or 
                 line.startswith('*') or
-                re.match(r'^\d+\)', line))
+                _NUMBERED_LIST_RE.match(line))
     
     def _estimate_dialogue_rounds(self, word_count: int) -> int:
         """估算對話輪數"""
@@ -155,48 +245,26 @@ class ContentAnalyzer:
         avg_words_per_round = 400
         return max(10, min(200, word_count // avg_words_per_round))
     
-    def _calculate_complexity(self, text: str) -> float:
+    def _calculate_complexity(self, words: List[str], length_variance: Optional[float], technical_terms: int) -> float:
         """計算文本複雜度 (0-100)"""
         # 基於多個因素計算複雜度
         factors = []
         
         # 詞彙豐富度
-        words = re.findall(r'[\u4e00-\u9fff]+', text)
         unique_words = len(set(words))
         total_words = len(words)
         vocab_richness = unique_words / max(1, total_words) if total_words > 0 else 0
         factors.append(vocab_richness * 100)
         
         # 句子長度變化
-        sentences = re.split(r'[。！？]', text)
-        sentence_lengths = [len(s.strip()) for s in sentences if s.strip()]
-        if sentence_lengths:
-            avg_length = sum(sentence_lengths) / len(sentence_lengths)
-            length_variance = sum((l - avg_length) ** 2 for l in sentence_lengths) / len(sentence_lengths)
+        if length_variance is not None:
             factors.append(min(100, length_variance / 10))
         
         # 專業術語密度
-        technical_terms = self._count_technical_terms(text)
         term_density = (technical_terms / max(1, total_words)) * 1000
         factors.append(min(100, term_density))
         
         return sum(factors) / len(factors) if factors else 50.0
-    
-    def _count_technical_terms(self, text: str) -> int:
-        """計算專業術語數量"""
-        technical_patterns = [
-            r'[A-Z]{2,}',  # 縮寫
-            r'\d+\.?\d*%',  # 百分比
-            r'\d+\.?\d*[A-Za-z]+',  # 帶單位的數字
-            r'[a-zA-Z]+tion',  # -tion結尾的詞
-            r'[a-zA-Z]+ism',  # -ism結尾的詞
-        ]
-        
-        count = 0
-        for pattern in technical_patterns:
-            count += len(re.findall(pattern, text))
-        
-        return count
 
 
 class ContentPlanner:
@@ -218,6 +286,12 @@ class ContentPlanner:
         """
         logger.info("開始創建內容大綱")
         
+        # 未指定目標輪數的短文本估算輪數不超過 50，只會建議一個部分，略過完整分析與段落分割
+        if target_rounds is None and len(text) < SMALL_TEXT_THRESHOLD:
+            estimated_rounds = self.analyzer._estimate_dialogue_rounds(len(text))
+            if self._calculate_suggested_parts(estimated_rounds) == 1:
+                return self._create_single_segment_outline(text, estimated_rounds)
+        
         # 分析內容
         analysis = self.analyzer.analyze_content(text)
         
@@ -244,6 +318,27 @@ class ContentPlanner:
         logger.info(f"內容大綱創建完成：{len(segments)}個片段，建議{suggested_parts}個部分")
         return outline
     
+    def _create_single_segment_outline(self, text: str, target_rounds: int) -> ContentOutline:
+        """為只需一個部分的短文本建立單一片段的大綱，只識別主題，略過結構與複雜度分析"""
+        words, _, _ = self.analyzer._scan_text(text)
+        main_topics = self.analyzer._identify_main_topics(text, self.analyzer._extract_keywords(words))
+        
+        segment = ContentSegment(
+            title=self._generate_segment_title(text, [], 1),
+            content=text,
+            keywords=[],
+            estimated_length=max(1, min(len(text) // 200, target_rounds * 2)),
+            priority=5
+        )
+        
+        logger.info("文本較短，略過內容分析，建立單一片段大綱")
+        return ContentOutline(
+            main_topic=main_topics[0] if main_topics else "一般主題",
+            segments=[segment],
+            total_estimated_length=segment.estimated_length,
+            suggested_parts=self._calculate_suggested_parts(target_rounds)
+        )
+    
     def _create_content_segments(self, text: str, analysis: Dict, target_rounds: int) -> List[ContentSegment]:
         """創建內容片段"""
         # 根據段落和主題分割內容
@@ -252,13 +347,22 @@ class ContentPlanner:
         if not paragraphs:
             paragraphs = [text]
         
+        # 段落過多時先合併相鄰段落，避免逐段比對關鍵詞並建立大量片段
+        max_paragraphs = max(1, target_rounds * MAX_PARAGRAPHS_PER_ROUND)
+        if len(paragraphs) > max_paragraphs:
+            logger.info(f"段落數 {len(paragraphs)} 超過上限 {max_paragraphs}，合併相鄰段落")
+            paragraphs = self._coalesce_paragraphs(paragraphs, max_paragraphs)
+        
         segments = []
         keywords = analysis['keywords']
         avg_rounds_per_segment = max(1, target_rounds // max(1, len(paragraphs)))
         
         for i, paragraph in enumerate(paragraphs):
+            # 每個關鍵詞只比對一次，結果同時供段落關鍵詞與優先級使用
+            matched = [index for index, kw in enumerate(keywords) if kw in paragraph]
+            
             # 提取段落關鍵詞
-            para_keywords = [kw for kw in keywords if kw in paragraph][:5]
+            para_keywords = [keywords[index] for index in matched[:5]]
             
             # 生成標題
             title = self._generate_segment_title(paragraph, para_keywords, i + 1)
@@ -267,7 +371,7 @@ class ContentPlanner:
             estimated_length = max(1, min(len(paragraph) // 200, avg_rounds_per_segment * 2))
             
             # 計算優先級
-            priority = self._calculate_segment_priority(paragraph, keywords)
+            priority = self._calculate_segment_priority(paragraph, sum(1 for index in matched if index < 10))
             
             segment = ContentSegment(
                 title=title,
@@ -281,13 +385,19 @@ class ContentPlanner:
         
         return segments
     
+    def _coalesce_paragraphs(self, paragraphs: List[str], max_count: int) -> List[str]:
+        """將相鄰段落依序平均合併為不超過 max_count 組"""
+        group_size = -(-len(paragraphs) // max_count)
+        return ['\n\n'.join(paragraphs[i:i + group_size]) for i in range(0, len(paragraphs), group_size)]
+    
     def _generate_segment_title(self, content: str, keywords: List[str], index: int) -> str:
         """生成段落標題"""
         # 嘗試從內容中提取現有標題
         lines = content.split('\n')
         for line in lines[:3]:  # 檢查前3行
+            line = line.strip()
             if self.analyzer._is_header(line):
-                return line.strip().replace('#', '').replace('：', '').strip()
+                return line.replace('#', '').replace('：', '').strip()
         
         # 如果沒有標題，根據關鍵詞生成
         if keywords:
@@ -296,10 +406,15 @@ class ContentPlanner:
         
         return f"第{index}部分討論"
     
-    def _calculate_segment_priority(self, content: str, global_keywords: List[str]) -> int:
-        """計算段落優先級 (1-10)"""
+    def _calculate_segment_priority(self, content: str, keyword_count: int) -> int:
+        """
+        計算段落優先級 (1-10)
+        
+        Args:
+            content: 段落內容
+            keyword_count: 段落中出現的前10個全局關鍵詞數量
+        """
         # 基於關鍵詞密度和內容長度
-        keyword_count = sum(1 for kw in global_keywords[:10] if kw in content)
         length_score = min(5, len(content) // 500)
         
         priority = min(10, max(1, keyword_count + length_score))
@@ -374,7 +489,7 @@ class SmartContentSplitter:
             # 確定主要焦點
             if focus_keywords:
                 keyword_counts = Counter(focus_keywords)
-                main_focus = keyword_counts.most_common(1)[0][0]
+                main_focus = max(keyword_counts.items(), key=itemgetter(1))[0]
                 focus = f"重點討論{main_focus}相關內容"
             else:
                 focus = f"第{i+1}部分的深入討論"
@@ -402,12 +517,17 @@ class SmartContentSplitter:
         if not segments:
             return "一般討論內容"
         
-        main_keywords = []
+        # 每個段落取前2個關鍵詞，依序去重，湊滿5個即停止
+        unique_keywords = []
+        seen = set()
         for segment in segments:
-            main_keywords.extend(segment.keywords[:2])  # 每個段落取前2個關鍵詞
-        
-        # 去重並取前5個
-        unique_keywords = list(dict.fromkeys(main_keywords))[:5]
+            for keyword in segment.keywords[:2]:
+                if keyword not in seen:
+                    seen.add(keyword)
+                    unique_keywords.append(keyword)
+            if len(unique_keywords) >= 5:
+                break
+        unique_keywords = unique_keywords[:5]
         
         if unique_keywords:
             return f"主要討論：{', '.join(unique_keywords)}"
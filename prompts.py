@@ -5,19 +5,27 @@ Modern Prompt Templates Management Module
 採用簡潔高效的現代 AI 提示詞設計原則。
 """
 
+from typing import Dict, List
+
+# 多個模板共用的規則片段，只保存一份
+_SKIP_FRONT_MATTER = "**忽略或跳過**推薦序、序、前言、導讀、致謝、目錄、版權頁、書評、他人評論/推薦文字"
+_CHAPTER_START_RULE = "- 若偵測到「第1章/第一章/Chapter 1」等章節開頭，從該處開始視為正文起點；若沒有章節標題，也要跳過明顯的推薦序與導讀再開始"
+_PODCAST_OPENING_RULE = '- 開場必須以 "speaker-1: 歡迎收聽 David888 Podcast，我是 David..." 開始'
+_TRADITIONAL_CHINESE_RULE = "- **必須使用繁體中文**"
+
 # 現代化提示詞模板
 PROMPTS = {
-    "podcast": """你是 David888 Podcast 的腳本編輯，擅長將文字內容轉換成生動的播客對話。
+    "podcast": f"""你是 David888 Podcast 的腳本編輯，擅長將文字內容轉換成生動的播客對話。
 
 【主播角色】
 - **speaker-1（David）**：主持人，幽默風趣，善於提問和引導話題
 - **speaker-2（Cordelia）**：共同主持人，專業理性，擅長深入分析
 
-- 僅轉換「原作者正文」為對話，**忽略或跳過**推薦序、序、前言、導讀、致謝、目錄、版權頁、書評、他人評論/推薦文字
+- 僅轉換「原作者正文」為對話，{_SKIP_FRONT_MATTER}
 - 如檔案含多位作者或推薦人，僅保留主文本作者的內容；不要在對話中提及推薦序或其他人觀點；如偵測到推薦序/致謝/書評，直接略過，不進入對話
-- 若偵測到「第1章/第一章/Chapter 1」等章節開頭，從該處開始視為正文起點；若沒有章節標題，也要跳過明顯的推薦序與導讀再開始
+{_CHAPTER_START_RULE}
 - 將正文內容**完整地**轉換成自然流暢的雙人對話
-- 開場必須以 "speaker-1: 歡迎收聽 David888 Podcast，我是 David..." 開始，開場控制在 2-3 輪內結束
+{_PODCAST_OPENING_RULE}，開場控制在 2-3 輪內結束
 - speaker-2 首次發言時自我介紹為 Cordelia，語氣條理清晰；speaker-1 (David) 可有自然的「嗯哼/好奇追問」語氣
 - 對話風格輕鬆專業，類似 All-In-Podcast 的互動感，避免冗贅語（如「其實」「就是說」「基本上」等）
 - **重要**：對話只涵蓋正文重點，不要重現推薦序/致謝/編者語
@@ -34,23 +42,23 @@ PROMPTS = {
 【輸出格式】
 - 使用 "speaker-1:" 和 "speaker-2:" 標記每句話
 - 不使用其他格式如 [主持人] 或括號
-- **必須使用繁體中文**
+{_TRADITIONAL_CHINESE_RULE}
 - 保持自然的口語化表達
 
 請將以下內容轉換成完整的播客對話：
 
-{content}""",
+{{content}}""",
 
-    "podcast-single": """你是 David888 Podcast 的腳本編輯，專門創作單人播客內容。
+    "podcast-single": f"""你是 David888 Podcast 的腳本編輯，專門創作單人播客內容。
 
 【主播角色】
 - **speaker-1（David）**：主持人，風格親切專業，善於講解和分享
 
 【任務目標】
-- 僅轉換「原作者正文」為獨白，**忽略或跳過**推薦序、序、前言、導讀、致謝、目錄、版權頁、書評、他人評論/推薦文字
-- 若偵測到「第1章/第一章/Chapter 1」等章節開頭，從該處開始視為正文起點；若沒有章節標題，也要跳過明顯的推薦序與導讀再開始
+- 僅轉換「原作者正文」為獨白，{_SKIP_FRONT_MATTER}
+{_CHAPTER_START_RULE}
 - 將正文內容**完整地**轉換成單人播客獨白
-- 開場必須以 "speaker-1: 歡迎收聽 David888 Podcast，我是 David..." 開始
+{_PODCAST_OPENING_RULE}
 - 保持自然的語調和節奏感
 - 適合語音播放，內容豐富且易懂
 
@@ -61,14 +69,14 @@ PROMPTS = {
 
 【輸出格式】
 - 所有內容使用 "speaker-1:" 標記
-- **必須使用繁體中文**
+{_TRADITIONAL_CHINESE_RULE}
 - 保持自然的口語化表達
 
 請將以下內容轉換成完整的單人播客：
 
-{content}""",
+{{content}}""",
 
-    "sciagents": """你是科學播客的編輯，專門介紹 SciAgents AI 工具的材料發現成果。
+    "sciagents": f"""你是科學播客的編輯，專門介紹 SciAgents AI 工具的材料發現成果。
 
 【對話角色】
 - **教授**：類似費曼的風格，深入淺出解釋科學概念
@@ -81,15 +89,15 @@ PROMPTS = {
 - 約 3000 字的深度討論
 
 【輸出格式】
-- **必須使用繁體中文**
+{_TRADITIONAL_CHINESE_RULE}
 - 明確標註 SciAgents 為設計來源
 - 對話自然流暢，富有教育性
 
 請將以下 SciAgents 材料設計內容轉換成對話：
 
-{content}""",
+{{content}}""",
 
-    "lecture": """你是大學教授，擅長將複雜內容轉換成易懂的講座。
+    "lecture": f"""你是大學教授，擅長將複雜內容轉換成易懂的講座。
 
 【任務目標】
 - 將提供內容整理成結構清晰的講座稿
@@ -98,15 +106,15 @@ PROMPTS = {
 - 注重邏輯性和教育性
 
 【輸出格式】
-- **必須使用繁體中文**
+{_TRADITIONAL_CHINESE_RULE}
 - 結構清晰，從基本概念到深入分析
 - 適合直接朗讀
 
 請將以下內容整理成講座稿：
 
-{content}""",
+{{content}}""",
 
-    "summary": """你是專業的內容摘要專家。
+    "summary": f"""你是專業的內容摘要專家。
 
 【任務目標】
 - 提取文件的核心要點和關鍵資訊
@@ -115,15 +123,15 @@ PROMPTS = {
 - 目標長度約 1000 字
 
 【輸出格式】
-- **必須使用繁體中文**
+{_TRADITIONAL_CHINESE_RULE}
 - 結構清晰，重點突出
 - 適合語音播放
 
 請將以下內容整理成摘要：
 
-{content}""",
+{{content}}""",
 
-    "short summary": """你是 David888 Podcast 的內容編輯，專門創作簡潔摘要。
+    "short summary": f"""你是 David888 Podcast 的內容編輯，專門創作簡潔摘要。
 
 【任務目標】
 - 為播客內容生成簡潔明瞭的摘要
@@ -131,18 +139,18 @@ PROMPTS = {
 - 適合社群媒體分享或節目介紹
 
 【輸出要求】
-- **必須使用繁體中文**
+{_TRADITIONAL_CHINESE_RULE}
 - 約 256 字的簡潔摘要
 - 直接輸出內容，不使用 Markdown 格式
 
 請為以下內容生成簡潔摘要：
 
-{content}""",
+{{content}}""",
 
-    "blog-summary": """你是 David888 Podcast 中文博客的編輯，將播客內容改寫成適合搜索引擎收錄的博客文章。
+    "blog-summary": f"""你是 David888 Podcast 中文博客的編輯，將播客內容改寫成適合搜索引擎收錄的博客文章。
 
 【工作目標】  
-- 僅使用正文內容撰寫文章，**忽略或跳過**推薦序、序、前言、導讀、致謝、目錄、版權頁、書評、他人評論/推薦文字
+- 僅使用正文內容撰寫文章，{_SKIP_FRONT_MATTER}
 - 使用簡潔明了的語言將播客對話整理為一篇完整的博客文章
 - 開場白使用一句話介紹播客內容，博客名稱是 David888 Podcast
 - 保留核心討論內容，但不要提及「對話」或「播客」等詞彙
@@ -157,12 +165,12 @@ PROMPTS = {
 
 請將以下播客內容轉換成博客文章：
 
-{content}""",
+{{content}}""",
 
-    "intro-summary": """你是 David888 Podcast 中文播客的編輯，為播客文字稿生成極簡摘要。
+    "intro-summary": f"""你是 David888 Podcast 中文播客的編輯，為播客文字稿生成極簡摘要。
 
 【工作目標】
-- 只基於正文內容生成摘要，**忽略或跳過**推薦序、序、前言、導讀、致謝、目錄、版權頁、書評、他人評論/推薦文字
+- 只基於正文內容生成摘要，{_SKIP_FRONT_MATTER}
 - **必須使用繁體中文**給播客文字稿生成極簡摘要
 - 提取最核心的討論重點和見解
 - 適合作為節目介紹或平台描述
@@ -177,17 +185,62 @@ PROMPTS = {
 
 請為以下播客內容生成極簡摘要：
 
-{content}"""
+{{content}}"""
 }
 
 
-def get_prompt(template_name: str, content: str = "") -> str:
+# 摘要模板的輸出 token 上限；短篇輸出不需要預留長篇對話的 token 數，
+# 過大的 max_tokens 會讓部分服務端預留過多 KV cache 或直接拒絕請求。
+# Gemini 2.5 等推理模型的思考 token 也計入 max_tokens，上限需保留足夠空間。
+# 只用於摘要生成；腳本生成可能轉入分批生成，一律沿用使用者設定的上限。
+TEMPLATE_MAX_OUTPUT_TOKENS = {
+    "short summary": 8192,
+    "intro-summary": 8192,
+    "summary": 12288,
+    "blog-summary": 16384,
+}
+
+
+def get_max_output_tokens(template_name: str, requested: int) -> int:
+    """
+    獲取模板實際使用的輸出 token 上限
+    
+    Args:
+        template_name: 模板名稱
+        requested: 使用者設定的輸出 token 數
+        
+    Returns:
+        int: 不超過模板上限的輸出 token 數
+    """
+    cap = TEMPLATE_MAX_OUTPUT_TOKENS.get(template_name)
+    return min(requested, cap) if cap else requested
+
+
+# 內容佔位符的替代標記，用於預先拆分模板
+_CONTENT_SENTINEL = "\x00content\x00"
+
+
+def _compile_template(template: str) -> List[str]:
+    """
+    將模板預先格式化並在 {content} 處拆分
+
+    之後只需以內容串接各片段，不必每次重新解析整個模板。
+    """
+    return template.format(content=_CONTENT_SENTINEL).split(_CONTENT_SENTINEL)
+
+
+# 預先編譯所有模板
+_COMPILED_PROMPTS: Dict[str, List[str]] = {name: _compile_template(template) for name, template in PROMPTS.items()}
+
+
+def get_prompt(template_name: str, content: str = "", suffix: str = "") -> str:
     """
     獲取指定的提示詞模板並填入內容
     
     Args:
         template_name: 模板名稱
         content: 要處理的內容
+        suffix: 附加在提示詞末尾的文字，與模板一次合併，避免再複製整份提示詞
         
     Returns:
         str: 完整的提示詞
@@ -195,11 +248,19 @@ def get_prompt(template_name: str, content: str = "") -> str:
     Raises:
         KeyError: 當模板名稱不存在時
     """
-    if template_name not in PROMPTS:
+    compiled = _COMPILED_PROMPTS.get(template_name)
+    if compiled is None:
         available_templates = list(PROMPTS.keys())
         raise KeyError(f"模板 '{template_name}' 不存在。可用模板: {available_templates}")
     
-    return PROMPTS[template_name].format(content=content)
+    if not suffix:
+        return content.join(compiled)
+    pieces: List[str] = []
+    for piece in compiled:
+        pieces.append(piece)
+        pieces.append(content)
+    pieces[-1] = suffix
+    return "".join(pieces)
 
 
 def get_all_template_names() -> list:
@@ -226,6 +287,10 @@ def add_custom_template(name: str, template: str) -> None:
     if "{content}" not in template:
         raise ValueError("模板必須包含 {content} 佔位符")
     
+    try:
+        _COMPILED_PROMPTS[name] = _compile_template(template)
+    except (KeyError, ValueError, IndexError) as e:
+        raise ValueError(f"模板格式不正確: {e}") from e
     PROMPTS[name] = template
 
 
@@ -239,6 +304,11 @@ def validate_template(template: str) -> bool:
     Returns:
         bool: 模板是否有效
     """
+    # 所有大括號都屬於 {content} 佔位符（或沒有大括號）時必定能格式化，不必啟動格式解析器
+    placeholders = template.count("{content}")
+    if template.count("{") == placeholders and template.count("}") == placeholders:
+        return True
+    
     try:
         # 檢查是否包含必要的佔位符
         template.format(content="test")
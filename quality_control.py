@@ -7,13 +7,46 @@ Quality Control Module
 """
 
 import re
+import hashlib
+import itertools
 import logging
+import threading
+from collections import OrderedDict
 from typing import Dict, List, Tuple, Optional
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 
 logger = logging.getLogger(__name__)
 
-@dataclass
+# check_dialogue_quality 結果快取的最大筆數，超過時淘汰最早加入的項目
+QUALITY_CACHE_MAX_ENTRIES = 32
+
+# 發言行的行首標記（小寫），以前綴比對取代不分大小寫的正則匹配
+_SPEAKER_PREFIXES = ('speaker-1:', 'speaker-2:')
+_SPEAKER_PREFIX_LENGTH = len(_SPEAKER_PREFIXES[0])
+
+# 預先編譯的發言者與格式檢查模式，避免每次檢查重新查找或解析
+_SPEAKER1_LINE_RE = re.compile(r'speaker-1:\s*(.+)', re.IGNORECASE)
+_FORMAT_TAG_RE = re.compile(r'\[Host\]|\[Guest\]|\[.*?\]')
+
+# 表示主題轉換的銜接詞，合併成單一模式，每行只需搜尋一次
+TRANSITION_KEYWORDS = (
+    '另外', '接下來', '說到', '談到', '回到', '轉個話題',
+    '順便提一下', '相關地', '類似地', '相比之下'
+)
+_TRANSITION_RE = re.compile('|'.join(map(re.escape, TRANSITION_KEYWORDS)))
+
+
+def _copy_report(report: "QualityReport") -> "QualityReport":
+    """複製品質報告（含問題與建議列表），快取中的報告不會被呼叫端修改"""
+    return replace(report, issues=list(report.issues), suggestions=list(report.suggestions))
+
+
+def _is_speaker_line(line: str) -> bool:
+    """判斷行首是否為 speaker-1: 或 speaker-2:（不分大小寫），只對行首數個字元做大小寫轉換"""
+    return line[:_SPEAKER_PREFIX_LENGTH].casefold().startswith(_SPEAKER_PREFIXES)
+
+
+@dataclass(slots=True)
 class QualityReport:
     """品質檢查報告"""
     overall_score: float  # 0-100 分
@@ -25,14 +58,27 @@ class QualityReport:
     suggestions: List[str]
 
 
+@dataclass(slots=True)
+class _DialogueLines:
+    """對話逐行掃描一次所得的統計"""
+    lines: List[str]  # 去除空白後的非空行
+    speaker_line_count: int  # 以 speaker-1/2 開頭的行數
+    speaker_line_chars: int  # 上述各行的總長度
+    malformed_count: int  # 疑似格式錯誤的發言行數
+
+
 class DialogueQualityChecker:
     """對話品質檢查器"""
     
     def __init__(self):
         self.speaker_patterns = {
-            'speaker-1': r'speaker-1:\s*',
-            'speaker-2': r'speaker-2:\s*'
+            'speaker-1': re.compile(r'speaker-1:\s*', re.IGNORECASE),
+            'speaker-2': re.compile(r'speaker-2:\s*', re.IGNORECASE)
         }
+        # (對話雜湊, 預期發言者) -> 品質報告，同一份腳本重複檢查時直接返回；
+        # 檢查器由多個生成請求共用，讀寫快取時需持有鎖
+        self._report_cache: "OrderedDict[Tuple[str, Tuple[str, ...]], QualityReport]" = OrderedDict()
+        self._report_cache_lock = threading.Lock()
         
     def check_dialogue_quality(self, dialogue: str, expected_speakers: List[str] = None) -> QualityReport:
         """
@@ -43,18 +89,28 @@ class DialogueQualityChecker:
             expected_speakers: 預期的發言者列表
             
         Returns:
-            QualityReport: 品質檢查報告
+            QualityReport: 品質檢查報告（每次返回獨立的副本，可自由修改）
         """
         if expected_speakers is None:
             expected_speakers = ['speaker-1', 'speaker-2']
+        
+        cache_key = (hashlib.blake2b(dialogue.encode("utf-8"), digest_size=16).hexdigest(), tuple(expected_speakers))
+        with self._report_cache_lock:
+            cached = self._report_cache.get(cache_key)
+        if cached is not None:
+            logger.info("使用快取的品質檢查結果")
+            return _copy_report(cached)
             
         logger.info("開始進行對話品質檢查")
         
+        # 逐行統計只掃描一次，供各項檢查共用
+        scan = self._scan_lines(dialogue, expected_speakers)
+        
         # 執行各項檢查
-        coherence_score = self._check_coherence(dialogue)
+        coherence_score = self._check_coherence(scan.lines)
         character_score = self._check_character_consistency(dialogue, expected_speakers)
-        content_score = self._check_content_richness(dialogue)
-        format_score = self._check_format_compliance(dialogue, expected_speakers)
+        content_score = self._check_content_richness(dialogue, scan)
+        format_score = self._check_format_compliance(dialogue, scan)
         
         # 計算總分
         overall_score = (coherence_score + character_score + content_score + format_score) / 4
@@ -75,11 +131,40 @@ class DialogueQualityChecker:
         )
         
         logger.info(f"品質檢查完成，總分: {overall_score:.1f}")
+        
+        with self._report_cache_lock:
+            self._report_cache[cache_key] = _copy_report(report)
+            while len(self._report_cache) > QUALITY_CACHE_MAX_ENTRIES:
+                self._report_cache.popitem(last=False)
         return report
     
-    def _check_coherence(self, dialogue: str) -> float:
-        """檢查對話的邏輯連貫性"""
-        lines = [line.strip() for line in dialogue.split('\n') if line.strip()]
+    def _scan_lines(self, dialogue: str, expected_speakers: List[str]) -> _DialogueLines:
+        """逐行掃描對話一次，收集連貫性、內容豐富度與格式檢查所需的統計"""
+        lines = []
+        speaker_line_count = 0
+        speaker_line_chars = 0
+        malformed_count = 0
+        
+        for raw_line in dialogue.split('\n'):
+            is_speaker_line = _is_speaker_line(raw_line)
+            if is_speaker_line:
+                speaker_line_count += 1
+                speaker_line_chars += len(raw_line)
+            
+            line = raw_line.strip()
+            if not line:
+                continue
+            lines.append(line)
+            
+            # 行首已是發言者標記時去除空白後仍然是，只有未匹配的行需要再檢查
+            if not is_speaker_line and not _is_speaker_line(line) and line not in expected_speakers:
+                if ':' in line and not line.startswith('#'):  # 可能是格式錯誤的發言
+                    malformed_count += 1
+        
+        return _DialogueLines(lines, speaker_line_count, speaker_line_chars, malformed_count)
+    
+    def _check_coherence(self, lines: List[str]) -> float:
+        """檢查對話的邏輯連貫性（lines 為去除空白後的非空行）"""
         if len(lines) < 5:
             return 30.0  # 對話太短
             
@@ -87,15 +172,17 @@ class DialogueQualityChecker:
         topic_transitions = 0
         abrupt_changes = 0
         
-        for i in range(1, len(lines)):
-            prev_line = lines[i-1].lower()
-            curr_line = lines[i].lower()
+        # 每行只轉換一次小寫，下一輪沿用為前一行
+        prev_line = lines[0].lower()
+        for line in lines[1:]:
+            curr_line = line.lower()
             
             # 簡單的主題連貫性檢查
             if self._is_topic_transition(prev_line, curr_line):
                 topic_transitions += 1
                 if self._is_abrupt_change(prev_line, curr_line):
                     abrupt_changes += 1
+            prev_line = curr_line
         
         if topic_transitions == 0:
             return 60.0  # 沒有主題變化可能表示內容單調
@@ -110,16 +197,17 @@ class DialogueQualityChecker:
         
         # 檢查發言者格式
         for speaker in expected_speakers:
-            pattern = self.speaker_patterns.get(speaker, f'{speaker}:\\s*')
-            matches = re.findall(pattern, dialogue, re.IGNORECASE)
+            pattern = self.speaker_patterns.get(speaker)
+            if pattern is None:
+                pattern = self.speaker_patterns[speaker] = re.compile(f'{speaker}:\\s*', re.IGNORECASE)
+            matches = pattern.findall(dialogue)
             
             if not matches:
                 score -= 30.0
                 issues.append(f"未找到發言者 {speaker}")
         
         # 檢查是否有無效的發言者標記
-        valid_patterns = '|'.join([f'{speaker}:' for speaker in expected_speakers])
-        invalid_speakers = re.findall(rf'(\w+):\s*(?!{valid_patterns})', dialogue, re.IGNORECASE)
+        invalid_speakers = self._find_invalid_speakers(dialogue, expected_speakers)
         
         if invalid_speakers:
             score -= len(set(invalid_speakers)) * 10
@@ -127,19 +215,45 @@ class DialogueQualityChecker:
         
         return max(0.0, score)
     
-    def _check_content_richness(self, dialogue: str) -> float:
+    def _find_invalid_speakers(self, dialogue: str, expected_speakers: List[str]) -> List[str]:
+        """
+        找出冒號前的詞作為發言者標記，排除冒號後緊接預期發言者標記的情況
+        
+        結果與 re.findall(r'(\w+):\s*(?!speaker-1:|...)', dialogue, re.IGNORECASE) 相同，
+        但只在冒號處往回取詞，不必在長串中文的每個位置嘗試匹配 \w+ 再回溯。
+        """
+        if not expected_speakers:
+            return []  # 空的否定預查永遠失敗，原模式不會有任何匹配
+        
+        valid_markers = tuple(f'{speaker}:'.lower() for speaker in expected_speakers)
+        marker_length = max(len(marker) for marker in valid_markers)
+        
+        speakers = []
+        colon = dialogue.find(':')
+        while colon != -1:
+            # 與 \w 相同：Unicode 字母數字或底線
+            start = colon
+            while start > 0 and (dialogue[start - 1].isalnum() or dialogue[start - 1] == '_'):
+                start -= 1
+            if start < colon:
+                following = dialogue[colon + 1:colon + 1 + marker_length].lower()
+                if not following.startswith(valid_markers):
+                    speakers.append(dialogue[start:colon])
+            colon = dialogue.find(':', colon + 1)
+        
+        return speakers
+    
+    def _check_content_richness(self, dialogue: str, scan: _DialogueLines) -> float:
         """檢查內容豐富度"""
-        # 計算對話輪數
-        turns = len(re.findall(r'speaker-[12]:', dialogue, re.IGNORECASE))
+        # 計算對話輪數：轉為小寫後以 str.count 計數，等同不分大小寫比對 speaker-[12]:
+        lowered = dialogue.lower()
+        turns = lowered.count('speaker-1:') + lowered.count('speaker-2:')
         
         # 計算平均每輪長度
-        lines = dialogue.split('\n')
-        content_lines = [line for line in lines if re.match(r'speaker-[12]:', line, re.IGNORECASE)]
-        
-        if not content_lines:
+        if not scan.speaker_line_count:
             return 0.0
             
-        avg_length = sum(len(line) for line in content_lines) / len(content_lines)
+        avg_length = scan.speaker_line_chars / scan.speaker_line_count
         
         # 評分標準
         turn_score = min(100, (turns / 50) * 100)  # 50輪為滿分
@@ -147,44 +261,31 @@ class DialogueQualityChecker:
         
         return (turn_score + length_score) / 2
     
-    def _check_format_compliance(self, dialogue: str, expected_speakers: List[str]) -> float:
+    def _check_format_compliance(self, dialogue: str, scan: _DialogueLines) -> float:
         """檢查格式規範性"""
         score = 100.0
         
         # 檢查是否以正確的開場白開始
         if 'speaker-1:' in dialogue:
-            first_speaker_line = re.search(r'speaker-1:\s*(.+)', dialogue, re.IGNORECASE)
+            first_speaker_line = _SPEAKER1_LINE_RE.search(dialogue)
             if first_speaker_line:
                 first_content = first_speaker_line.group(1).strip()
                 if '歡迎收聽' not in first_content or 'David888 Podcast' not in first_content:
                     score -= 20.0
         
         # 檢查是否有不當的格式標記
-        if re.search(r'\[Host\]|\[Guest\]|\[.*?\]', dialogue):
+        if _FORMAT_TAG_RE.search(dialogue):
             score -= 30.0
         
         # 檢查行格式
-        lines = dialogue.split('\n')
-        malformed_lines = 0
-        for line in lines:
-            line = line.strip()
-            if line and not re.match(r'speaker-[12]:', line, re.IGNORECASE) and line not in expected_speakers:
-                if ':' in line and not line.startswith('#'):  # 可能是格式錯誤的發言
-                    malformed_lines += 1
-        
-        if malformed_lines > 0:
-            score -= min(40.0, malformed_lines * 5)
+        if scan.malformed_count > 0:
+            score -= min(40.0, scan.malformed_count * 5)
         
         return max(0.0, score)
     
     def _is_topic_transition(self, prev_line: str, curr_line: str) -> bool:
         """判斷是否為主題轉換"""
-        transition_keywords = [
-            '另外', '接下來', '說到', '談到', '回到', '轉個話題',
-            '順便提一下', '相關地', '類似地', '相比之下'
-        ]
-        
-        return any(keyword in curr_line for keyword in transition_keywords)
+        return _TRANSITION_RE.search(curr_line) is not None
     
     def _is_abrupt_change(self, prev_line: str, curr_line: str) -> bool:
         """判斷是否為突兀的主題變化"""
@@ -194,7 +295,8 @@ class DialogueQualityChecker:
             
         # 這裡可以實現更複雜的語義分析
         # 目前使用簡單的關鍵詞檢查
-        common_words = set(prev_line.split()) & set(curr_line.split())
+        # 只為前一行建立集合，直接與當前行的詞求交集，少建立一個集合
+        common_words = set(prev_line.split()).intersection(curr_line.split())
         return len(common_words) < 2
     
     def _generate_feedback(self, dialogue: str, coherence: float, character: float, 
@@ -279,15 +381,26 @@ class ContentCoherenceAnalyzer:
         if not topic_distribution:
             return 50.0
         
-        # 話題分布的均勻度
-        values = list(topic_distribution.values())
-        if max(values) == 0:
+        # 話題分布的均勻度，一次遍歷同時取得最大與最小值
+        values = iter(topic_distribution.values())
+        lowest = highest = next(values)
+        for value in values:
+            if value < lowest:
+                lowest = value
+            elif value > highest:
+                highest = value
+        if highest == 0:
             return 50.0
         
-        uniformity = 1 - (max(values) - min(values)) / max(values)
+        uniformity = 1 - (highest - lowest) / highest
         return uniformity * 100
 
 
+def _has_podcast_opening(dialogue: str) -> bool:
+    """檢查是否包含 David888 Podcast 的開場白"""
+    return '歡迎收聽' in dialogue and 'David888 Podcast' in dialogue
+
+
 def validate_dialogue_structure(dialogue: str, template_type: str = 'podcast') -> bool:
     """
     驗證對話結構是否符合模板要求
@@ -299,29 +412,31 @@ def validate_dialogue_structure(dialogue: str, template_type: str = 'podcast') -
     Returns:
         bool: 是否符合結構要求
     """
+    # 以短路求值依序檢查，任一條件不符即返回，不再搜尋其餘標記
     if template_type == 'podcast':
-        # 檢查是否有兩個發言者
-        has_speaker1 = 'speaker-1:' in dialogue
-        has_speaker2 = 'speaker-2:' in dialogue
-        
-        # 檢查開場白
-        has_opening = '歡迎收聽' in dialogue and 'David888 Podcast' in dialogue
-        
-        return has_speaker1 and has_speaker2 and has_opening
+        # 需要兩個發言者及開場白
+        return ('speaker-1:' in dialogue and
+                'speaker-2:' in dialogue and
+                _has_podcast_opening(dialogue))
     
     elif template_type == 'podcast-single':
-        # 檢查是否只有一個發言者
-        has_speaker1 = 'speaker-1:' in dialogue
-        has_speaker2 = 'speaker-2:' in dialogue
-        
-        # 檢查開場白
-        has_opening = '歡迎收聽' in dialogue and 'David888 Podcast' in dialogue
-        
-        return has_speaker1 and not has_speaker2 and has_opening
+        # 只能有一個發言者，並需要開場白
+        return ('speaker-1:' in dialogue and
+                _has_podcast_opening(dialogue) and
+                'speaker-2:' not in dialogue)
     
     return True  # 其他模板暫不檢查
 
 
+# 額外建議規則：(報告欄位, 分數門檻, 低於門檻時的建議)
+_SUGGESTION_RULES = (
+    ('overall_score', 60, "整體品質較低，建議重新生成並調整提示詞"),
+    ('coherence_score', 60, "增加內容規劃步驟，確保邏輯流暢"),
+    ('character_consistency_score', 60, "檢查角色定義，確保發言風格一致"),
+    ('content_richness_score', 60, "增加內容深度和對話互動性"),
+)
+
+
 def suggest_improvements(quality_report: QualityReport) -> List[str]:
     """
     根據品質報告提供改進建議
@@ -332,18 +447,9 @@ def suggest_improvements(quality_report: QualityReport) -> List[str]:
     Returns:
         List[str]: 改進建議列表
     """
-    suggestions = quality_report.suggestions.copy()
-    
-    if quality_report.overall_score < 60:
-        suggestions.append("整體品質較低，建議重新生成並調整提示詞")
-    
-    if quality_report.coherence_score < 60:
-        suggestions.append("增加內容規劃步驟，確保邏輯流暢")
-    
-    if quality_report.character_consistency_score < 60:
-        suggestions.append("檢查角色定義，確保發言風格一致")
-    
-    if quality_report.content_richness_score < 60:
-        suggestions.append("增加內容深度和對話互動性")
-    
-    return list(set(suggestions))  # 去重
\ No newline at end of file
+    extra_suggestions = (
+        message for field, threshold, message in _SUGGESTION_RULES
+        if getattr(quality_report, field) < threshold
+    )
+    # 去重並保留原順序
+    return list(dict.fromkeys(itertools.chain(quality_report.suggestions, extra_suggestions)))